@@ -1,15 +1,47 @@
-import gradio as gr
-import requests
+import asyncio
 import base64
 from PIL import Image
 from io import BytesIO
 from pathlib import Path
-import fitz
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from extraction_cache import ExtractionCache, SingleFlight, hash_bytes
+from lazy_import import lazy_import
+from vllm_client import VllmClient, VllmError
+
+# Loaded on first use: Gradio when the UI is built, PyMuPDF with the first PDF
+gr = lazy_import("gradio")
+fitz = lazy_import("fitz")
 
 print("=== DEBUG: Starting app.py ===")
 
+MODEL_NAME = "numind/NuMarkdown-8B-Thinking"
+DEFAULT_TEMPERATURE = 0.4
+DEFAULT_MAX_TOKENS = 12_000
+VLLM_IMAGE_MAX_SIZE = int(os.environ.get("VLLM_IMAGE_MAX_SIZE", "2048"))
+VLLM_PDF_DPI = float(os.environ.get("VLLM_PDF_DPI", "200"))
+VLLM_MAX_PDF_PAGES = int(os.environ.get("VLLM_MAX_PDF_PAGES", "20"))
+VLLM_STREAM = os.environ.get("VLLM_STREAM", "1") != "0"
+STREAM_UPDATE_INTERVAL = float(os.environ.get("STREAM_UPDATE_INTERVAL", "0.1"))
+# start.sh launches the UI while vLLM is still loading the model
+VLLM_STARTUP_TIMEOUT = float(os.environ.get("VLLM_STARTUP_TIMEOUT", "900"))
+VLLM_CACHE = ExtractionCache.from_env("numarkdown")
+VLLM_CLIENT = VllmClient()
+VLLM_IN_FLIGHT = SingleFlight()
+# Gradio queue: how many extractions run at once (by default as many as vLLM batches),
+# how many may wait, and GRADIO_BATCH_SIZE > 1 to hand queued requests over in groups
+GRADIO_CONCURRENCY_LIMIT = int(os.environ.get("GRADIO_CONCURRENCY_LIMIT", VLLM_CLIENT.max_in_flight))
+GRADIO_MAX_QUEUE_SIZE = int(os.environ.get("GRADIO_MAX_QUEUE_SIZE", "200"))
+GRADIO_BATCH_SIZE = max(1, int(os.environ.get("GRADIO_BATCH_SIZE", "1")))
+LOAD_SAMPLE_INTERVAL = float(os.environ.get("LOAD_SAMPLE_INTERVAL", "5"))
+MODEL_LOADING_MESSAGE = "The NuMarkdown model is still loading (this takes a few minutes after a restart). Please try again shortly."
+_vllm_ready = False
+
 # Get example images
-import os
 example_dir = os.path.join(os.environ.get('HOME', '/home/user'), 'app', 'example_images')
 # example_dir = "example_images"  # Relative path since it's in the same directory
 example_images = []
@@ -20,156 +52,580 @@ if os.path.exists(example_dir):
     print(f"Found {len(example_images)} example images")
 
 def encode_image_to_base64(image: Image.Image) -> str:
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
     buffered = BytesIO()
     image.save(buffered, format="JPEG")
     img_str = base64.b64encode(buffered.getvalue()).decode()
     return f"data:image/jpeg;base64,{img_str}"
 
-def load_image_from_input(file_path, image):
-    if image is not None:
+def pixmap_to_image(pix):
+    """Wrap an RGB pixmap's samples as a PIL image without copying or PNG round-tripping."""
+    return Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1)
+
+
+def pdf_page_zoom(page, max_size=VLLM_IMAGE_MAX_SIZE, dpi=VLLM_PDF_DPI):
+    """Zoom that renders ``page`` at ``dpi`` but never past ``max_size`` pixels on its long side."""
+    return min(dpi / 72, max_size / max(page.rect.width, page.rect.height))
+
+
+def fit_size(size, max_size=VLLM_IMAGE_MAX_SIZE):
+    if max(size) <= max_size:
+        return tuple(size)
+    ratio = max_size / max(size)
+    return tuple(max(1, int(dim * ratio)) for dim in size)
+
+
+def downscale_to_fit(image: Image.Image, max_size=VLLM_IMAGE_MAX_SIZE) -> Image.Image:
+    new_size = fit_size(image.size, max_size)
+    if new_size == image.size:
         return image
+    return image.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
 
-    if not file_path:
-        return None
+
+@contextmanager
+def load_image_from_input(file_path, image, max_size=VLLM_IMAGE_MAX_SIZE, page_number=0):
+    """
+    Yields the input (page ``page_number`` for PDFs) as a PIL image no larger
+    than ``max_size``, or None.
+    PDF pages are rendered straight at that size and JPEG files are decoded at
+    a reduced scale, so the pixels are produced once instead of rendered and
+    resized. A rendered page shares the pixmap's buffer, so it is only valid
+    inside the block and is closed before the pixmap is released.
+    """
+    if image is not None or not file_path:
+        yield downscale_to_fit(image, max_size) if image is not None else None
+        return
 
     path = Path(file_path)
-    if path.suffix.lower() == ".pdf":
-        doc = fitz.open(file_path)
-        if doc.page_count == 0:
-            doc.close()
-            return None
-        page = doc.load_page(0)
-        pix = page.get_pixmap(dpi=200)
+    if path.suffix.lower() != ".pdf":
+        with Image.open(file_path) as opened:
+            opened.draft("RGB", fit_size(opened.size, max_size))
+            yield downscale_to_fit(opened, max_size)
+        return
+
+    doc = fitz.open(file_path)
+    if page_number >= doc.page_count:
         doc.close()
-        return Image.open(BytesIO(pix.tobytes("png")))
+        yield None
+        return
+    page = doc.load_page(page_number)
+    zoom = pdf_page_zoom(page, max_size)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+    doc.close()
+    page_image = pixmap_to_image(pix)
+    try:
+        yield page_image
+    finally:
+        page_image.close()
+        del pix
+
 
-    return Image.open(file_path)
+def input_page_count(file_path, image):
+    """Returns ``(pages to send, total pages)``; PDFs send up to VLLM_MAX_PDF_PAGES pages."""
+    if image is not None:
+        return 1, 1
+    if not file_path:
+        return 0, 0
+    if Path(file_path).suffix.lower() != ".pdf":
+        return 1, 1
+    with fitz.open(file_path) as doc:
+        total = doc.page_count
+    return min(total, VLLM_MAX_PDF_PAGES), total
 
 
-def query_vllm_api(file_path, image, temperature, max_tokens=12_000):
-    print(
-        f"=== DEBUG: query_vllm_api called with file={bool(file_path)}, image={image is not None}, temp={temperature} ==="
+def prepare_image_payload(file_path, image, max_size=VLLM_IMAGE_MAX_SIZE, page_number=0):
+    """Load the input at its final size and return it as a JPEG data URL (None if missing)."""
+    started = time.perf_counter()
+    with load_image_from_input(file_path, image, max_size, page_number) as loaded:
+        if loaded is None:
+            return None
+        size = loaded.size
+        image_b64 = encode_image_to_base64(loaded)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"=== DEBUG: Prepared page {page_number + 1} ({size[0]}x{size[1]}) in {elapsed_ms:.1f} ms, payload {len(image_b64) / 1024:.0f} KB ===")
+    return image_b64
+
+
+def input_content_hash(file_path, image):
+    """Hash the pixels of a pasted image, or the bytes of an uploaded file."""
+    if image is not None:
+        rgb = image.convert("RGB")
+        return hash_bytes(f"{rgb.size}".encode() + rgb.tobytes())
+    if file_path:
+        return hash_bytes(Path(file_path).read_bytes())
+    return None
+
+
+def vllm_cache_key(content_hash, temperature, max_tokens):
+    return VLLM_CACHE.make_key(
+        content_hash,
+        model=MODEL_NAME,
+        temperature=round(float(temperature), 2),
+        max_tokens=max_tokens,
+        pages="all",
     )
 
-    image = load_image_from_input(file_path, image)
-    if image is None:
-        return "No file provided", "No file provided", "Please upload an invoice image or PDF first."
 
+def split_reasoning_answer(result):
     try:
-        messages = []
-        # Optional: Resize image if needed (to avoid huge uploads)
-        max_size = 2048
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = tuple(int(dim * ratio) for dim in image.size)
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-        image_b64 = encode_image_to_base64(image)
-        messages.append({
+        reasoning = result.split("<think>")[1].split("</think>")[0]
+        answer = result.split("<answer>")[1].split("</answer>")[0]
+    except IndexError:
+        # If no thinking tags, return the full result
+        reasoning = "No thinking trace found"
+        answer = result
+    return reasoning, answer
+
+
+def _tag_section(text, open_tag, close_tag):
+    if open_tag not in text:
+        return None
+    section = text.split(open_tag, 1)[1].split(close_tag, 1)[0]
+    # Hide a closing tag that has only partly arrived
+    cut = section.rfind("<")
+    if cut != -1 and close_tag.startswith(section[cut:]):
+        section = section[:cut]
+    return section
+
+
+def split_partial_result(text):
+    """Like split_reasoning_answer, for output that is still streaming in."""
+    reasoning = _tag_section(text, "<think>", "</think>")
+    answer = _tag_section(text, "<answer>", "</answer>")
+    head = text.lstrip()[:len("<think>")]
+    if reasoning is None and answer is None and not "<think>".startswith(head):
+        # No tags at all: show the text as the answer, like the final split does
+        return "", text
+    return reasoning or "", answer or ""
+
+
+async def query_vllm_page(file_path, image, page_number, temperature, max_tokens, on_text=None):
+    """
+    Render one page and extract it; returns ``(reasoning, answer)``. With
+    ``on_text`` the response is streamed and ``on_text(page_number, text_so_far)``
+    is called as tokens arrive.
+    """
+    image_b64 = await asyncio.to_thread(prepare_image_payload, file_path, image, VLLM_IMAGE_MAX_SIZE, page_number)
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [{
             "role": "user",
             "content": [
                 {"type": "image_url", "image_url": {"url": image_b64}}
             ]
-        })
-
-        payload = {
-            "model": "numind/NuMarkdown-8B-Thinking",
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature
-        }
-
-        print("=== DEBUG: About to make vLLM API request ===")
-        response = requests.post(
-            "http://localhost:8000/v1/chat/completions",
-            json=payload,
-            timeout=60
+        }],
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    }
+
+    print(f"=== DEBUG: Sending page {page_number + 1} to vLLM ({VLLM_CLIENT.in_flight} in flight, {VLLM_CLIENT.waiting} waiting) ===")
+    if on_text is None:
+        data = await VLLM_CLIENT.chat_completion(payload)
+        return split_reasoning_answer(data["choices"][0]["message"]["content"])
+
+    text = ""
+    async for delta in VLLM_CLIENT.stream_chat_completion(payload):
+        text += delta
+        on_text(page_number, text)
+    return split_reasoning_answer(text)
+
+
+def merge_page_results(results, total_pages):
+    """
+    Join per-page answers in page order. Reasoning stays per page under a
+    heading; a failed or cancelled page is reported in place instead of being
+    dropped. Returns ``(reasoning, answer, complete)``.
+    """
+    if len(results) == 1 and total_pages == 1:
+        result = results[0]
+        if isinstance(result, BaseException):
+            error_msg = f"API request failed: {str(result) or type(result).__name__}"
+            return error_msg, error_msg, False
+        return result[0], result[1], True
+
+    reasoning_parts, answer_parts = [], []
+    complete = True
+    for page_number, result in enumerate(results, start=1):
+        if isinstance(result, BaseException):
+            # gather(return_exceptions=True) also hands back CancelledError, which is no Exception
+            reason = str(result) or type(result).__name__
+            complete = False
+            reasoning_parts.append(f"### Page {page_number}\n\nAPI request failed: {reason}")
+            answer_parts.append(f"> Page {page_number} could not be extracted: {reason}")
+        else:
+            reasoning_parts.append(f"### Page {page_number}\n\n{result[0].strip()}")
+            answer_parts.append(result[1].strip())
+    if total_pages > len(results):
+        note = f"Only the first {len(results)} of {total_pages} pages were processed (VLLM_MAX_PDF_PAGES)."
+        reasoning_parts.append(note)
+        answer_parts.append(f"> {note}")
+    return "\n\n".join(reasoning_parts), "\n\n".join(answer_parts), complete
+
+
+class VllmJob:
+    """
+    One extraction in flight: every page sent at once, with the streamed text
+    so far kept per page so any number of identical requests can follow it.
+    """
+
+    def __init__(self, file_path, image, page_count, temperature, max_tokens, stream):
+        self.partial_text = [""] * page_count
+        self.version = 0
+        # Every page goes out at once; vLLM batches them, so a 5-page invoice costs about one page
+        self.pages = asyncio.gather(
+            *(query_vllm_page(file_path, image, page_number, temperature, max_tokens, self.on_text if stream else None)
+              for page_number in range(page_count)),
+            return_exceptions=True,
         )
-        response.raise_for_status()
-        data = response.json()
 
-        result = data["choices"][0]["message"]["content"]
+    def on_text(self, page_number, text):
+        self.partial_text[page_number] = text
+        self.version += 1
+
+    def done(self):
+        return self.pages.done()
+
+    def cancel(self):
+        # The last user waiting for this navigated away or cancelled: stop generating
+        return self.pages.cancel()
+
+    def add_done_callback(self, callback):
+        self.pages.add_done_callback(lambda _: callback(self.pages))
+
+
+@contextmanager
+def run_alone(start):
+    """SingleFlight.join's shape for work that no other request may attach to."""
+    work = start()
+    try:
+        yield work, False
+    finally:
+        if not work.done():
+            work.cancel()
+
+
+async def query_vllm_api(file_path, image, temperature, max_tokens=DEFAULT_MAX_TOKENS, stream=VLLM_STREAM, coalesce=True):
+    """
+    Gradio handler yielding ``(reasoning, raw answer, markdown)``. When
+    streaming, partial output is yielded at most every STREAM_UPDATE_INTERVAL
+    seconds while the pages generate; the final, merged result comes last.
+    With ``coalesce`` False the request never joins or offers its work through
+    VLLM_IN_FLIGHT, which belongs to Gradio's event loop.
+    """
+    print(
+        f"=== DEBUG: query_vllm_api called with file={bool(file_path)}, image={image is not None}, temp={temperature} ==="
+    )
+
+    cache_key = None
+    content_hash = await asyncio.to_thread(input_content_hash, file_path, image)
+    if content_hash:
+        cache_key = vllm_cache_key(content_hash, temperature, max_tokens)
+        cached = await asyncio.to_thread(VLLM_CACHE.get, cache_key)
+        if cached is not None:
+            print("=== DEBUG: Extraction cache hit ===")
+            reasoning, answer = cached
+            yield reasoning, answer, answer
+            return
+
+    try:
+        page_count, total_pages = await asyncio.to_thread(input_page_count, file_path, image)
+        if page_count == 0:
+            yield "No file provided", "No file provided", "Please upload an invoice image or PDF first."
+            return
+        if not await vllm_is_ready():
+            yield MODEL_LOADING_MESSAGE, MODEL_LOADING_MESSAGE, MODEL_LOADING_MESSAGE
+            return
+
+        start_job = lambda: VllmJob(file_path, image, page_count, temperature, max_tokens, stream)
+        flight = VLLM_IN_FLIGHT.join(cache_key, start_job) if coalesce else run_alone(start_job)
+        with flight as (job, shared):
+            if shared:
+                print("=== DEBUG: Attached to an identical in-flight request ===")
+            seen = 0
+            while not job.done():
+                await asyncio.wait({job.pages}, timeout=STREAM_UPDATE_INTERVAL)
+                if job.version != seen and not job.done():
+                    seen = job.version
+                    reasoning, answer, _ = merge_page_results([split_partial_result(text) for text in job.partial_text], total_pages)
+                    yield reasoning, answer, answer
+            results = job.pages.result()
+
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, VllmError):
+                raise result
+        reasoning, answer, complete = merge_page_results(results, total_pages)
+        if not complete:
+            print(f"=== DEBUG: Request error: {reasoning} ===")
+
+        if cache_key and complete and not shared:
+            await asyncio.to_thread(VLLM_CACHE.put, cache_key, [reasoning, answer])
+        yield reasoning, answer, answer
 
-        # Handle the thinking/answer parsing
-        try:
-            reasoning = result.split("<think>")[1].split("</think>")[0]
-            answer = result.split("<answer>")[1].split("</answer>")[0]
-        except IndexError:
-            # If no thinking tags, return the full result
-            reasoning = "No thinking trace found"
-            answer = result
-
-        return reasoning, answer, answer
-
-    except requests.exceptions.RequestException as e:
-        error_msg = f"API request failed: {e}"
-        print(f"=== DEBUG: Request error: {error_msg} ===")
-        return error_msg, error_msg, error_msg
     except Exception as e:
         error_msg = f"Unexpected error: {e}"
         print(f"=== DEBUG: Unexpected error: {error_msg} ===")
-        return error_msg, error_msg, error_msg
+        yield error_msg, error_msg, error_msg
 
-print("=== DEBUG: Creating Gradio interface ===")
+async def final_result(results):
+    """Drain one of query_vllm_api's generators and return its last (final) output."""
+    output = None
+    async for output in results:
+        pass
+    return output
 
 
-with gr.Blocks(title="CreditFlow Pro - Invoice OCR") as demo:
-    gr.HTML("""
-    <div style="text-align: left; padding: 20px 24px; background: #FFFFFF; border: 1px solid #E1E7F0; border-radius: 16px; margin-bottom: 16px;">
-        <h1 style="color: #0B1220; margin: 0; font-size: 1.6em; font-weight: 700;">Invoice OCR</h1>
-        <p style="color: #667085; margin: 6px 0 0; font-size: 0.98em;">Upload an invoice PDF or image to extract data.</p>
-    </div>
-    """)
+async def query_vllm_batch(file_paths, images, temperatures):
+    """
+    Batched Gradio handler (GRADIO_BATCH_SIZE > 1): Gradio hands over up to that
+    many queued requests at once and their pages are sent to vLLM together, so
+    they are scheduled in the same batch instead of trickling in. Batches do not
+    stream; returns one list per output.
+    """
+    print(f"=== DEBUG: Dispatching a batch of {len(file_paths)} requests ===")
+    outputs = await asyncio.gather(*(
+        final_result(query_vllm_api(file_path, image, temperature, stream=False))
+        for file_path, image, temperature in zip(file_paths, images, temperatures)
+    ))
+    return [list(column) for column in zip(*outputs)]
 
 
-    with gr.Row():
-        with gr.Column(scale=2):
-            temperature = gr.Slider(0.1, 1.2, value=0.4, step=0.1, label="Creativity")
-            btn = gr.Button("Extract Invoice", variant="primary", size="lg")
-            file_in = gr.File(
-                label="Invoice PDF or Image",
-                file_types=[".pdf", ".png", ".jpg", ".jpeg", ".webp"],
-                type="filepath",
-            )
-            img_in = gr.Image(type="pil", label="Or paste an image")
-
-        with gr.Column(scale=2):
-            with gr.Accordion("🔍 Extraction Output", open=True):
-                with gr.Tabs():
-                    with gr.TabItem("🧠 Reasoning"):
-                        thinking = gr.Textbox(
-                            lines=15,
-                            max_lines=25,
-                            show_label=False,
-                            placeholder="The model's reasoning process will appear here...",
-                        )
-                    with gr.TabItem("📝 Rendered Markdown"):
-                        output = gr.Markdown(label="📝 Extracted Markdown")
-                    with gr.TabItem("📄 Raw Output"):
-                        raw_answer = gr.Textbox(
-                            lines=15,
-                            max_lines=25,
-                            show_label=False,
-                            placeholder="The raw model output will appear here...",
-                        )
-
-    btn.click(
-        query_vllm_api,
-        inputs=[file_in, img_in, temperature],
-        outputs=[thinking, raw_answer, output],
-    )
+async def vllm_is_ready():
+    """True once vLLM has answered a health check; until then every call checks again."""
+    global _vllm_ready
+    if not _vllm_ready:
+        _vllm_ready = await VLLM_CLIENT.ping()
+    return _vllm_ready
+
+
+async def wait_for_vllm(timeout=VLLM_STARTUP_TIMEOUT, interval=2.0):
+    """Poll vLLM until it is ready; False if it still is not after ``timeout`` seconds."""
+    deadline = time.monotonic() + timeout
+    while not await vllm_is_ready():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+async def warm_example_cache():
+    """
+    Precompute extractions for the bundled examples (once vLLM is up) so the
+    first clicks are instant. Runs on its own thread and event loop, so it only
+    shares VLLM_CACHE with the UI, never in-flight work.
+    """
+    if not await wait_for_vllm():
+        print(f"=== DEBUG: vLLM not ready after {VLLM_STARTUP_TIMEOUT:.0f}s, skipping example warm-up ===")
+        await VLLM_CLIENT.close()
+        return
+    print("=== DEBUG: vLLM is ready ===")
+    for path in example_images[:5]:
+        try:
+            with Image.open(path) as example:
+                await final_result(query_vllm_api(None, example.convert("RGB"), DEFAULT_TEMPERATURE, stream=False, coalesce=False))
+        except Exception as e:
+            print(f"=== DEBUG: Could not precompute {path}: {e} ===")
+    await VLLM_CLIENT.close()
+    print(f"=== DEBUG: Example cache warmed: {VLLM_CACHE.stats()} ===")
+
+class LoadTracker:
+    """
+    Samples GPU throughput (finished pages and generated tokens, from the
+    VllmClient counters) against the backlog: requests waiting in Gradio's
+    queue plus pages waiting for a vLLM slot. Gives users an estimated wait
+    and shows whether throughput still grows as the queue does.
+    """
+
+    # Lower bounds of the backlog ranges throughput is grouped by
+    BACKLOG_BUCKETS = (0, 1, 5, 17, 65)
+
+    def __init__(self, client, window=60.0):
+        self.client = client
+        self.window = window
+        self.queue_length = lambda: 0
+        self._samples = deque()
+        self._by_backlog = {}
+        self._lock = threading.Lock()
 
-    # Add examples if we have any
-    if example_images:
-        gr.Examples(
-            examples=example_images[:5],  # Limit to 5 examples
-            inputs=img_in,
-            label="📸 Try these example images"
+    def backlog(self):
+        return self.queue_length() + self.client.waiting
+
+    def _bucket(self, backlog):
+        return max(bound for bound in self.BACKLOG_BUCKETS if bound <= backlog)
+
+    def sample(self):
+        now = time.monotonic()
+        current = (now, self.client.completion_tokens, self.client.completed, self.backlog())
+        with self._lock:
+            if self._samples:
+                last = self._samples[-1]
+                # The interval since the last sample counts towards the backlog seen then
+                totals = self._by_backlog.setdefault(self._bucket(last[3]), [0.0, 0, 0])
+                totals[0] += now - last[0]
+                totals[1] += current[1] - last[1]
+                totals[2] += current[2] - last[2]
+            self._samples.append(current)
+            while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+        return current
+
+    def rates(self):
+        """``(tokens/s, pages/s)`` over the last ``window`` seconds."""
+        with self._lock:
+            if len(self._samples) < 2:
+                return 0.0, 0.0
+            first, last = self._samples[0], self._samples[-1]
+        span = last[0] - first[0]
+        return (last[1] - first[1]) / span, (last[2] - first[2]) / span
+
+    def estimated_wait(self):
+        """Seconds before a request arriving now reaches vLLM; None until throughput is known."""
+        backlog = self.backlog()
+        if backlog == 0:
+            return 0.0
+        _, pages_per_second = self.rates()
+        return backlog / pages_per_second if pages_per_second > 0 else None
+
+    def summary_markdown(self):
+        tokens_per_second, pages_per_second = self.rates()
+        wait = self.estimated_wait()
+        wait_text = "unknown (no pages finished yet)" if wait is None else f"~{wait:.0f} s"
+        lines = [
+            f"**Queue:** {self.queue_length()} waiting in line, {self.client.waiting} pages waiting for the GPU, "
+            f"{self.client.in_flight} pages generating",
+            f"**Estimated wait for a new request:** {wait_text}",
+            f"**GPU throughput (last {self.window:.0f} s):** {tokens_per_second:.0f} tokens/s, "
+            f"{pages_per_second * 60:.1f} pages/min",
+            "",
+            "| Backlog | Observed | Tokens/s | Pages/min |",
+            "|---|---|---|---|",
+        ]
+        with self._lock:
+            rows = sorted(self._by_backlog.items())
+        bounds = self.BACKLOG_BUCKETS + (None,)
+        for bound, (seconds, tokens, pages) in rows:
+            upper = bounds[bounds.index(bound) + 1]
+            label = f"{bound}+" if upper is None else str(bound) if upper == bound + 1 else f"{bound}-{upper - 1}"
+            per_second = 1 / seconds if seconds > 0 else 0.0
+            lines.append(f"| {label} | {seconds:.0f} s | {tokens * per_second:.0f} | {pages * per_second * 60:.1f} |")
+        return "\n".join(lines)
+
+    def run(self, interval=LOAD_SAMPLE_INTERVAL):
+        """Sample forever (in a daemon thread), logging while there is work."""
+        while True:
+            _, _, _, backlog = self.sample()
+            if backlog or self.client.in_flight:
+                tokens_per_second, pages_per_second = self.rates()
+                print(f"=== DEBUG: Load: backlog {backlog}, generating {self.client.in_flight}, "
+                      f"{tokens_per_second:.0f} tokens/s, {pages_per_second * 60:.1f} pages/min ===")
+            time.sleep(interval)
+
+
+LOAD_TRACKER = LoadTracker(VLLM_CLIENT)
+
+
+def gradio_queue_length(demo):
+    """
+    Requests waiting in Gradio's queue. Gradio exposes no public queue length,
+    so this reads the private ``Blocks._queue``; should that go away it counts
+    0 and the backlog falls back to the pages waiting in VllmClient.
+    """
+    try:
+        return len(demo._queue)
+    except (AttributeError, TypeError):
+        return 0
+
+
+def build_demo():
+    """Build the Gradio UI; called at launch so importing this module stays cheap."""
+    print("=== DEBUG: Creating Gradio interface ===")
+
+    with gr.Blocks(title="CreditFlow Pro - Invoice OCR") as demo:
+        gr.HTML("""
+        <div style="text-align: left; padding: 20px 24px; background: #FFFFFF; border: 1px solid #E1E7F0; border-radius: 16px; margin-bottom: 16px;">
+            <h1 style="color: #0B1220; margin: 0; font-size: 1.6em; font-weight: 700;">Invoice OCR</h1>
+            <p style="color: #667085; margin: 6px 0 0; font-size: 0.98em;">Upload an invoice PDF or image to extract data.</p>
+        </div>
+        """)
+
+
+        with gr.Row():
+            with gr.Column(scale=2):
+                temperature = gr.Slider(0.1, 1.2, value=DEFAULT_TEMPERATURE, step=0.1, label="Creativity")
+                btn = gr.Button("Extract Invoice", variant="primary", size="lg")
+                file_in = gr.File(
+                    label="Invoice PDF or Image",
+                    file_types=[".pdf", ".png", ".jpg", ".jpeg", ".webp"],
+                    type="filepath",
+                )
+                img_in = gr.Image(type="pil", label="Or paste an image")
+
+            with gr.Column(scale=2):
+                with gr.Accordion("🔍 Extraction Output", open=True):
+                    with gr.Tabs():
+                        with gr.TabItem("🧠 Reasoning"):
+                            thinking = gr.Textbox(
+                                lines=15,
+                                max_lines=25,
+                                show_label=False,
+                                placeholder="The model's reasoning process will appear here...",
+                            )
+                        with gr.TabItem("📝 Rendered Markdown"):
+                            output = gr.Markdown(label="📝 Extracted Markdown")
+                        with gr.TabItem("📄 Raw Output"):
+                            raw_answer = gr.Textbox(
+                                lines=15,
+                                max_lines=25,
+                                show_label=False,
+                                placeholder="The raw model output will appear here...",
+                            )
+
+        with gr.Accordion("📈 Server load", open=False):
+            load_status = gr.Markdown(LOAD_TRACKER.summary_markdown())
+
+        if GRADIO_BATCH_SIZE > 1:
+            btn.click(
+                query_vllm_batch,
+                inputs=[file_in, img_in, temperature],
+                outputs=[thinking, raw_answer, output],
+                batch=True,
+                max_batch_size=GRADIO_BATCH_SIZE,
+                # Each running batch fills GRADIO_BATCH_SIZE of the vLLM slots
+                concurrency_limit=max(1, GRADIO_CONCURRENCY_LIMIT // GRADIO_BATCH_SIZE),
+            )
+        else:
+            btn.click(
+                query_vllm_api,
+                inputs=[file_in, img_in, temperature],
+                outputs=[thinking, raw_answer, output],
+                # The client bounds what reaches vLLM; let Gradio hand it that many requests at once
+                concurrency_limit=GRADIO_CONCURRENCY_LIMIT,
+            )
+        gr.Timer(LOAD_SAMPLE_INTERVAL).tick(
+            LOAD_TRACKER.summary_markdown, outputs=load_status, queue=False, show_progress="hidden",
+            api_visibility="private",
         )
 
-print("=== DEBUG: Gradio interface created ===")
+        # Add examples if we have any
+        if example_images:
+            gr.Examples(
+                examples=example_images[:5],  # Limit to 5 examples
+                inputs=img_in,
+                label="📸 Try these example images"
+            )
+
+    # Users see their position and Gradio's ETA while queued; beyond max_size they are turned away
+    demo.queue(max_size=GRADIO_MAX_QUEUE_SIZE, default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT)
+    LOAD_TRACKER.queue_length = lambda: gradio_queue_length(demo)
+    print("=== DEBUG: Gradio interface created ===")
+    return demo
+
 
 if __name__ == "__main__":
+    threading.Thread(target=asyncio.run, args=(warm_example_cache(),), daemon=True).start()
+    demo = build_demo()
+    threading.Thread(target=LOAD_TRACKER.run, daemon=True).start()
+    print(f"=== DEBUG: Queue: {GRADIO_CONCURRENCY_LIMIT} concurrent, up to {GRADIO_MAX_QUEUE_SIZE} waiting, batch size {GRADIO_BATCH_SIZE} ===")
     print("=== DEBUG: About to launch Gradio ===")
     demo.launch(
         server_name="0.0.0.0",
@@ -0,0 +1,217 @@
+"""
+Benchmark for the word-box layout engine behind extract_items_from_image.
+
+Builds synthetic ``image_to_data`` output for dense invoices and times the
+columnar layout (numpy and pure-Python fallback) against the previous
+dict-per-word implementation, checking that all three return the same items.
+
+    python benchmarks/bench_layout.py --items 50 200 1000 --repeat 20
+"""
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import simple_server  # noqa: E402
+
+
+def synthetic_word_data(n_items: int, seed: int = 0):
+    """image_to_data-shaped dict for a header row, ``n_items`` rows and a total row."""
+    rng = random.Random(seed)
+    data = {key: [] for key in ("text", "block_num", "par_num", "line_num", "left", "top", "width", "height", "conf")}
+    columns = [("Item", 40), ("Qty", 620), ("Unit", 760), ("Rate", 900), ("GST", 1080), ("Amount", 1260)]
+
+    def add_line(line_num, top, words):
+        for text, left in words:
+            data["text"].append(text)
+            data["block_num"].append(2)
+            data["par_num"].append(1)
+            data["line_num"].append(line_num)
+            data["left"].append(left + rng.randint(-6, 6))
+            data["top"].append(top + rng.randint(-3, 3))
+            data["width"].append(14 * len(text))
+            data["height"].append(28)
+            data["conf"].append(round(rng.uniform(70, 97), 2))
+        # Tesseract also emits empty entries for block/paragraph/line levels
+        data["text"].append("")
+        for key in ("block_num", "par_num", "line_num", "left", "top", "width", "height"):
+            data[key].append(0)
+        data["conf"].append(-1)
+
+    add_line(1, 300, columns)
+    for i in range(1, n_items + 1):
+        qty = rng.randint(1, 40)
+        rate = rng.randint(5, 900) + 0.5
+        amount = qty * rate * 1.18
+        words = [(str(i), 40), ("Steel", 90), ("Bolt", 190), (f"M{rng.randint(4, 20)}", 280),
+                 (str(qty), 620), ("nos", 760), (f"{rate:.2f}", 900), ("18%", 1080), (f"{amount:,.2f}", 1260)]
+        # Words arrive in Tesseract's order, not strictly left to right
+        rng.shuffle(words)
+        add_line(i + 1, 300 + 40 * i, words)
+    add_line(n_items + 2, 300 + 40 * (n_items + 1), [("Grand", 900), ("Total", 1000), ("99,999.00", 1260)])
+    return data
+
+
+def legacy_extract_items_from_data(data):
+    """The dict-per-word layout that extract_items_from_data replaced, kept as a baseline."""
+    def normalize_token(text: str):
+        return re.sub(r'[^a-z]', '', text.lower())
+
+    def parse_number(text: str):
+        match = re.findall(r'[0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?', text)
+        if not match:
+            return None
+        value = match[-1].replace(',', '').replace(' ', '')
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    def parse_quantity(text: str):
+        match = re.findall(r'[0-9]+(?:\.\d+)?', text)
+        if not match:
+            return None
+        try:
+            return float(match[0])
+        except ValueError:
+            return None
+
+    lines_map = {}
+    for i in range(len(data["text"])):
+        text = data["text"][i].strip()
+        if not text:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines_map.setdefault(key, []).append({
+            "text": text, "left": data["left"][i], "top": data["top"][i],
+            "width": data["width"][i], "height": data["height"][i],
+        })
+
+    lines = sorted(lines_map.values(), key=lambda words: min(w["top"] for w in words))
+    if not lines:
+        return []
+
+    header_index = None
+    columns = {}
+    for idx, words in enumerate(lines):
+        line_text = " ".join(w["text"] for w in sorted(words, key=lambda w: w["left"]))
+        lower = line_text.lower()
+        if "item" in lower and "amount" in lower:
+            header_index = idx
+            for word in words:
+                token = normalize_token(word["text"])
+                if token in {"item", "items", "name", "itemname"}:
+                    columns["item"] = min(columns.get("item", word["left"]), word["left"])
+                elif token in {"qty", "quantity"}:
+                    columns["quantity"] = word["left"]
+                elif token in {"unit"}:
+                    columns["unit"] = word["left"]
+                elif token in {"price", "rate"}:
+                    columns["price"] = word["left"]
+                elif token in {"gst", "tax"}:
+                    columns["gst"] = word["left"]
+                elif token in {"amount", "amt"}:
+                    columns["amount"] = word["left"]
+            if "item" not in columns:
+                columns["item"] = min(w["left"] for w in words)
+            if "amount" in columns:
+                break
+
+    if header_index is None or "amount" not in columns:
+        return []
+
+    column_order = sorted(columns.items(), key=lambda entry: entry[1])
+    col_names = [name for name, _ in column_order]
+
+    def assign_column(word):
+        x_center = word["left"] + word["width"] / 2
+        assigned = col_names[0]
+        for name, pos in column_order:
+            if x_center >= pos:
+                assigned = name
+            else:
+                break
+        return assigned
+
+    items = []
+    for words in lines[header_index + 1:]:
+        line_text = " ".join(w["text"] for w in sorted(words, key=lambda w: w["left"]))
+        if not line_text.strip():
+            continue
+        if "total" in line_text.lower():
+            break
+        buckets = {name: [] for name in col_names}
+        for word in sorted(words, key=lambda w: w["left"]):
+            buckets[assign_column(word)].append(word["text"])
+        row = {name: " ".join(tokens).strip() for name, tokens in buckets.items() if tokens}
+        tokens = row.get("item", "").split()
+        index = None
+        if tokens and tokens[0].isdigit():
+            index = tokens[0]
+            tokens = tokens[1:]
+        description = " ".join(tokens).strip()
+        quantity = parse_quantity(row.get("quantity", ""))
+        unit = row.get("unit", "").split()[0] if row.get("unit") else None
+        rate = parse_number(row.get("price", ""))
+        amount = parse_number(row.get("amount", ""))
+        gst_value = parse_number(row.get("gst", ""))
+        if not description and row.get("item"):
+            description = row.get("item")
+        if amount is None and rate is None:
+            continue
+        if quantity is None:
+            quantity = 1
+        if rate is None and amount is not None and quantity:
+            rate = amount / quantity
+        items.append({"index": index or str(len(items) + 1), "description": description, "quantity": quantity,
+                      "unit": unit, "rate": rate, "amount": amount, "gst": gst_value})
+    return items
+
+
+def time_call(func, data, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(data)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def columnar_python(data):
+    numpy_available = simple_server.NUMPY_AVAILABLE
+    simple_server.NUMPY_AVAILABLE = False
+    try:
+        return simple_server.extract_items_from_data(data)
+    finally:
+        simple_server.NUMPY_AVAILABLE = numpy_available
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[20, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    variants = [("legacy", legacy_extract_items_from_data), ("columnar-python", columnar_python)]
+    if simple_server.NUMPY_AVAILABLE:
+        variants.append(("columnar-numpy", simple_server.extract_items_from_data))
+
+    print(f"{'items':>6} " + " ".join(f"{name + ' ms':>20}" for name, _ in variants) + f" {'speedup':>8}")
+    for n_items in args.items:
+        data = synthetic_word_data(n_items)
+        expected = legacy_extract_items_from_data(data)
+        assert len(expected) == n_items, f"legacy layout found {len(expected)} of {n_items} items"
+        timings = []
+        for name, func in variants:
+            assert func(data) == expected, f"{name} layout differs from legacy output"
+            timings.append(time_call(func, data, args.repeat))
+        print(f"{n_items:>6} " + " ".join(f"{t:>20.3f}" for t in timings) + f" {timings[0] / min(timings[1:]):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""
+Equivalence check and benchmark for parse_invoice_text (InvoiceTextParser).
+
+Feeds random invoice-like texts, built from fragments the parser reacts to
+(labels, amounts, GST lines, dates, item rows, run-together words), to both
+the current parser and the regex-per-call implementation it replaced, fails
+on the first text where their output differs, then times both.
+
+    python benchmarks/bench_parser.py --texts 20000 --seed 0
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import simple_server  # noqa: E402
+
+FRAGMENTS = [
+    "Grand Total", "Total Amount", "total payable", "Amount Due", "amount payable", "Net Total", "net amount",
+    "Balance", "Invoice Total", "Total", "Sub Total", "SUBTOTAL", "CGST @9%", "SGST @ 9 %", "IGST@18%", "GST 5%",
+    "Item", "Amount", "items", "Rs.", "₹", "INR", "Rs", "1,234.50", "12", "3", "18.0%", "(18.0%)", "9.00", "nos",
+    "box", "Kg", "pcs", "ABCD1234", "Invoice No.: 398", "INV-77", "Invoice # 12", "Invoice Number: AB-12",
+    "Date: 16-11-2024", "01/02/2023", "31-02-2024", "GSTIN: 27ABCDE1234F1Z5", "Acme Traders", "Phone", "email",
+    "Original", "Tax Invoice", "-", "/", "(5%)", "1", "2", "10", "100.00", "5,000", "Qty", "Rate", "totalamount",
+    "subtotal amount due", "grand totalbalance", "xcgsty", "amountdue", "4 Widgets 2 nos 50.00 9.00 (18.0%) 118.00",
+    "ABC", "99", "0.5",
+]
+
+
+def random_text(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(0, 40)):
+        separator = " " * rng.randint(0, 2)
+        lines.append(separator.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 8))))
+    return "\n".join(lines)
+
+
+def legacy_parse_invoice_text(text: str, filename: str):
+    """The regex-per-call parser that InvoiceTextParser replaced, kept unchanged as the reference output."""
+    data = {
+        "invoice_number": "",
+        "date": "",
+        "due_date": "",
+        "vendor": "",
+        "total": "0",
+        "description": "",
+        "notes": "",
+        "items": []
+    }
+
+    if not text:
+        return data
+
+    # Extract invoice number - look for patterns like "Invoice No.: 398", "INV-123", etc.
+    invoice_patterns = [
+        r'Invoice\s+No\.?\s*:?\s*(\d+)',
+        r'Invoice\s+#\s*(\d+)',
+        r'INV[-\s]?(\d+)',
+        r'Invoice\s+Number\s*:?\s*([A-Z0-9-]+)'
+    ]
+    for pattern in invoice_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            data["invoice_number"] = f"INV-{match.group(1)}"
+            break
+
+    # Extract date - look for patterns like "Date: 16-11-2024", "16/11/2024", etc.
+    date_patterns = [
+        r'Date\s*:?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{4})',
+        r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})'
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            date_str = match.group(1)
+            # Convert to YYYY-MM-DD format
+            if '-' in date_str:
+                parts = date_str.split('-')
+            else:
+                parts = date_str.split('/')
+
+            if len(parts) == 3:
+                day, month, year = parts
+                if len(year) == 4:
+                    data["date"] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+            break
+
+    # Extract vendor/company name - usually at the top
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    for line in lines[:10]:  # Check first 10 lines
+        if line and len(line) > 3 and not any(skip in line.lower() for skip in ['invoice', 'original', 'tax', 'gst', 'phone', 'email']):
+            if not re.match(r'^[A-Z0-9-]+\s*$', line):  # Not just numbers/codes
+                data["vendor"] = line
+                break
+
+    def parse_amount(value: str):
+        cleaned = value.replace(',', '').replace(' ', '')
+        try:
+            return float(cleaned)
+        except ValueError:
+            return None
+
+    currency_pattern = r'(?:₹|Rs\.?|INR)\s*([0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?)'
+    plain_amount_pattern = r'([0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?)'
+
+    def extract_amounts(line: str, allow_plain: bool = False):
+        amounts = []
+        for match in re.finditer(currency_pattern, line, re.IGNORECASE):
+            amount = parse_amount(match.group(1))
+            if amount is not None:
+                amounts.append(amount)
+        if allow_plain and not amounts:
+            for match in re.finditer(plain_amount_pattern, line):
+                if '-' in line or '/' in line:
+                    continue
+                amount = parse_amount(match.group(1))
+                if amount is not None:
+                    amounts.append(amount)
+        return amounts
+
+    def is_number_token(token: str):
+        return re.fullmatch(r'[0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?', token) is not None
+
+    def parse_float_token(token: str):
+        return parse_amount(token)
+
+    unit_tokens = {
+        "nos", "no", "box", "rol", "roll", "pcs", "pkt", "pack", "set",
+        "kg", "g", "gm", "ltr", "l", "litre", "meter", "m"
+    }
+
+    def parse_item_line(line: str):
+        cleaned = re.sub(r'\(\s*\d+(\.\d+)?\s*%\s*\)', '', line)
+        cleaned = cleaned.replace('₹', ' ').replace('Rs.', ' ').replace('INR', ' ')
+        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+        if not re.match(r'^\d+\s+', cleaned):
+            return None
+
+        tokens = cleaned.split()
+        item_index = tokens[0]
+        tokens = tokens[1:]
+
+        unit_index = None
+        for idx, token in enumerate(tokens):
+            if token.lower() in unit_tokens:
+                unit_index = idx
+                break
+
+        qty = None
+        unit = None
+        if unit_index is not None and unit_index > 0 and is_number_token(tokens[unit_index - 1]):
+            qty = parse_float_token(tokens[unit_index - 1])
+            unit = tokens[unit_index]
+
+        numeric_tokens = [parse_float_token(t) for t in tokens if is_number_token(t)]
+        numeric_tokens = [n for n in numeric_tokens if n is not None]
+
+        amount = None
+        rate = None
+        gst_value = None
+
+        if numeric_tokens:
+            amount = numeric_tokens[-1]
+            if len(numeric_tokens) >= 4:
+                rate = numeric_tokens[-3]
+            elif len(numeric_tokens) == 3:
+                rate = numeric_tokens[-2]
+            elif len(numeric_tokens) == 2:
+                rate = numeric_tokens[0]
+
+        # Attempt to capture GST value (e.g. "9.00 (18.0%)")
+        gst_match = re.search(r'([0-9]+(?:\.[0-9]{1,2})?)\s*\(?\s*18\.0?\s*%?\s*\)?', line)
+        if gst_match:
+            gst_value = parse_amount(gst_match.group(1))
+
+        item_name_end = None
+        if unit_index is not None:
+            item_name_end = max(unit_index - 1, 0)
+        else:
+            for idx, token in enumerate(tokens):
+                if is_number_token(token):
+                    item_name_end = idx
+                    break
+
+        if item_name_end is None:
+            item_name_end = len(tokens)
+
+        name_tokens = tokens[:item_name_end]
+        name_tokens = [t for t in name_tokens if not re.fullmatch(r'[A-Z0-9]{4,}', t)]
+        item_name = " ".join(name_tokens).strip()
+        if not item_name:
+            item_name = f"Item {item_index}"
+
+        if qty is None and numeric_tokens:
+            qty = numeric_tokens[0]
+        if qty is None:
+            qty = 1
+
+        if gst_value is not None:
+            gross_from_gst = gst_value * (1.18 / 0.18)
+            if amount is None or abs(gross_from_gst - amount) / max(amount, 1) > 0.08:
+                amount = gross_from_gst
+
+        if rate is None and amount is not None and qty:
+            rate = amount / qty if qty else amount
+
+        if amount is None and rate is not None and qty is not None:
+            amount = rate * qty
+
+        return {
+            "index": item_index,
+            "description": item_name,
+            "quantity": qty,
+            "unit": unit,
+            "rate": rate,
+            "amount": amount,
+            "gst": gst_value
+        }
+
+    label_priority = [
+        ("grand total", 4),
+        ("total amount", 4),
+        ("total payable", 4),
+        ("amount due", 4),
+        ("amount payable", 4),
+        ("net total", 4),
+        ("net amount", 4),
+        ("balance", 3),
+        ("invoice total", 3),
+        ("total", 3),
+        ("sub total", 1),
+        ("subtotal", 1),
+    ]
+
+    candidates = []
+    for idx, line in enumerate(lines):
+        lower = line.lower()
+        matched_priority = None
+        for label, priority in label_priority:
+            if label in lower:
+                matched_priority = priority
+                break
+
+        if matched_priority is None:
+            continue
+
+        amounts = extract_amounts(line, allow_plain=True)
+        if not amounts and idx + 1 < len(lines):
+            amounts = extract_amounts(lines[idx + 1], allow_plain=True)
+        for amount in amounts:
+            candidates.append((matched_priority, amount))
+
+    def find_label_amount(labels):
+        for idx, line in enumerate(lines):
+            lower = line.lower()
+            if any(label in lower for label in labels):
+                amounts = extract_amounts(line, allow_plain=True)
+                if not amounts and idx + 1 < len(lines):
+                    amounts = extract_amounts(lines[idx + 1], allow_plain=True)
+                if amounts:
+                    return max(amounts)
+        return None
+
+    if candidates:
+        _, best_amount = max(candidates, key=lambda item: (item[0], item[1]))
+        data["total"] = f"₹{best_amount:.2f}"
+    else:
+        fallback_amounts = []
+        for line in lines:
+            fallback_amounts.extend(extract_amounts(line, allow_plain=False))
+        if fallback_amounts:
+            data["total"] = f"₹{max(fallback_amounts):.2f}"
+
+    subtotal_amount = find_label_amount(["sub total", "subtotal"])
+    cgst_amount = find_label_amount(["cgst"])
+    sgst_amount = find_label_amount(["sgst"])
+    igst_amount = find_label_amount(["igst"])
+
+    if subtotal_amount and any([cgst_amount, sgst_amount, igst_amount]):
+        computed_total = subtotal_amount + (cgst_amount or 0) + (sgst_amount or 0) + (igst_amount or 0)
+        current_total_value = parse_amount(data["total"].replace("₹", "")) if data["total"] else None
+        if current_total_value is None or computed_total > current_total_value * 1.02:
+            data["total"] = f"₹{computed_total:.2f}"
+
+    # Extract line items
+    items = []
+    for line in lines:
+        item = parse_item_line(line)
+        if not item or not item.get("description"):
+            continue
+        if item.get("amount") is None and item.get("rate") is None:
+            continue
+        items.append(item)
+
+    if items:
+        seen = set()
+        unique_items = []
+        for item in items:
+            key = (item.get("description"), round(item.get("amount", 0), 2))
+            if key in seen:
+                continue
+            seen.add(key)
+            unique_items.append(item)
+        try:
+            unique_items.sort(key=lambda entry: int(entry.get("index", 0)))
+        except Exception:
+            pass
+        data["items"] = unique_items
+    else:
+        # Fallback: attempt to parse items from table text region
+        start_idx = None
+        end_idx = None
+        for idx, line in enumerate(lines):
+            lower = line.lower()
+            if start_idx is None and ("item" in lower and "amount" in lower):
+                start_idx = idx + 1
+                continue
+            if start_idx is not None and "total" in lower:
+                end_idx = idx
+                break
+        table_lines = lines[start_idx:end_idx] if start_idx is not None else lines
+        table_text = " ".join(table_lines)
+        chunks = re.split(r'(?<!\d)(\d{1,2})\s+', table_text)
+        fallback_items = []
+        for i in range(1, len(chunks), 2):
+            item_text = f"{chunks[i]} {chunks[i + 1]}".strip()
+            item = parse_item_line(item_text)
+            if item and item.get("description") and item.get("amount") is not None:
+                fallback_items.append(item)
+        if fallback_items:
+            seen = set()
+            unique_items = []
+            for item in fallback_items:
+                key = (item.get("description"), round(item.get("amount", 0), 2))
+                if key in seen:
+                    continue
+                seen.add(key)
+                unique_items.append(item)
+            try:
+                unique_items.sort(key=lambda entry: int(entry.get("index", 0)))
+            except Exception:
+                pass
+            data["items"] = unique_items
+
+    # Extract GSTIN if available
+    gstin_match = re.search(r'GSTIN\s*:?\s*([A-Z0-9]+)', text, re.IGNORECASE)
+    if gstin_match:
+        data["notes"] = f"GSTIN: {gstin_match.group(1)}"
+
+    # Detect GST rate
+    def parse_percent(match):
+        try:
+            return float(match.group(1))
+        except Exception:
+            return None
+
+    lower_text = text.lower()
+    has_gst_tokens = any(token in lower_text for token in ["gst", "cgst", "sgst", "igst"])
+    cgst_rate = None
+    sgst_rate = None
+    igst_rate = None
+    gst_rate = None
+
+    cgst_match = re.search(r'cgst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
+    sgst_match = re.search(r'sgst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
+    igst_match = re.search(r'igst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
+    if cgst_match:
+        cgst_rate = parse_percent(cgst_match)
+    if sgst_match:
+        sgst_rate = parse_percent(sgst_match)
+    if igst_match:
+        igst_rate = parse_percent(igst_match)
+
+    if igst_rate is not None:
+        gst_rate = igst_rate
+    elif cgst_rate is not None and sgst_rate is not None:
+        gst_rate = cgst_rate + sgst_rate
+    else:
+        gst_match = re.search(r'gst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
+        if gst_match:
+            gst_rate = parse_percent(gst_match)
+
+    if gst_rate is None and not has_gst_tokens:
+        gst_rate = 0
+
+    if gst_rate is not None:
+        data["gst_rate"] = gst_rate
+        data["has_gst"] = gst_rate > 0
+    else:
+        data["has_gst"] = has_gst_tokens
+
+    # Set description from vendor or filename
+    if data["vendor"]:
+        data["description"] = f"Invoice from {data['vendor']}"
+    else:
+        data["description"] = f"Scanned invoice: {filename}"
+
+    # Calculate due date (30 days from invoice date if date is available)
+    if data["date"]:
+        try:
+            from datetime import datetime, timedelta
+            invoice_date = datetime.strptime(data["date"], "%Y-%m-%d")
+            due_date = invoice_date + timedelta(days=30)
+            data["due_date"] = due_date.strftime("%Y-%m-%d")
+        except:
+            pass
+
+    return data
+
+
+def time_parser(func, texts) -> float:
+    started = time.perf_counter()
+    for text in texts:
+        func(text, "bench.pdf")
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=20000, help="random texts compared")
+    parser.add_argument("--timed", type=int, default=3000, help="texts timed per parser")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for i in range(args.texts):
+        text = random_text(rng)
+        expected = legacy_parse_invoice_text(text, "bench.pdf")
+        actual = simple_server.parse_invoice_text(text, "bench.pdf")
+        if actual != expected:
+            print(f"Text {i} parses differently:\n{text!r}\nlegacy:  {expected}\ncurrent: {actual}")
+            sys.exit(1)
+    print(f"{args.texts} random texts: current parser output matches the legacy parser")
+
+    texts = [random_text(rng) for _ in range(args.timed)]
+    legacy_ms = time_parser(legacy_parse_invoice_text, texts)
+    current_ms = time_parser(simple_server.parse_invoice_text, texts)
+    print(f"{args.timed} texts: legacy {legacy_ms:.1f} ms, current {current_ms:.1f} ms ({legacy_ms / current_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Per-page latency and memory of the PDF-to-PIL handoff used before OCR.
+
+Compares the old path (RGB pixmap -> PNG bytes -> Image.open -> convert("L"))
+with render_page_image (grayscale pixmap wrapped by Image.frombuffer).
+
+    python benchmarks/bench_pixmap.py [invoice.pdf] --dpi 300 --repeat 3
+"""
+import argparse
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import simple_server  # noqa: E402
+
+
+def synthetic_pdf(pages: int = 3) -> "fitz.Document":
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for line in range(45):
+            page.insert_text((50, 60 + line * 16), f"{line + 1} Steel bolt M{8 + line % 6} 10 nos 45.00 18% 531.00 page {page_num + 1}")
+    return doc
+
+
+def image_bytes(img):
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+def png_roundtrip(page, dpi):
+    """Returns the image size and the bytes of every buffer alive at the end of the handoff."""
+    pix = page.get_pixmap(dpi=dpi)
+    png = pix.tobytes("png")
+    decoded = Image.open(BytesIO(png))
+    decoded.load()
+    gray = decoded.convert("L")
+    return gray.size, len(pix.samples) + len(png) + image_bytes(decoded) + image_bytes(gray)
+
+
+def zero_copy(page, dpi):
+    with simple_server.render_page_image(page, dpi) as img:
+        img.load()
+        return img.size, image_bytes(img)
+
+
+def measure(func, page, dpi, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, buffer_bytes = func(page, dpi)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), buffer_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF to render (default: a synthetic 3-page invoice)")
+    parser.add_argument("--dpi", type=int, default=simple_server.PDF_OCR_DPI)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf) if args.pdf else synthetic_pdf()
+    print(f"{'page':>4} {'size':>11} {'png ms':>8} {'zero-copy ms':>13} {'png MB':>8} {'zero-copy MB':>13}")
+    for page_num, page in enumerate(doc):
+        png_ms, png_bytes = measure(png_roundtrip, page, args.dpi, args.repeat)
+        zc_ms, zc_bytes = measure(zero_copy, page, args.dpi, args.repeat)
+        size, _ = zero_copy(page, args.dpi)
+        print(f"{page_num + 1:>4} {size[0]:>5}x{size[1]:<5} {png_ms:>8.1f} {zc_ms:>13.1f} "
+              f"{png_bytes / 2**20:>8.1f} {zc_bytes / 2**20:>13.1f}")
+    print("MB = pixel/PNG buffers alive at the end of the handoff (pixmap, PNG bytes, decoded and grayscale copies)")
+
+
+if __name__ == "__main__":
+    main()
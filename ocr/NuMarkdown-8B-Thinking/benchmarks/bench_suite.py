@@ -0,0 +1,208 @@
+"""
+End-to-end speed and accuracy benchmark on synthetic GST invoices.
+
+Generates invoices with known ground truth (see invoice_generator.py) and reports:
+  * per-stage latency percentiles: parse_invoice_text, preprocess_image,
+    extract_items_from_image and the whole /upload path (with the server's own
+    per-stage timings underneath it)
+  * /upload docs/sec at the requested concurrency
+  * peak Python heap per stage (tracemalloc) and peak RSS of the server and its OCR workers
+  * field accuracy against the ground truth, per document kind
+
+The extraction cache is disabled so every upload does the full work. Stages that
+need Tesseract are skipped when it is not installed.
+
+    python benchmarks/bench_suite.py --docs 20 --items 12 --pages 1 --noise 0.01 --rotation 1 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Measure real work, not cache hits; per-stage server timings come back with OCR_DEBUG
+os.environ["OCR_CACHE_DIR"] = ""
+os.environ["OCR_CACHE_MEMORY_MB"] = "0"
+os.environ["OCR_DEBUG"] = "1"
+
+import fitz  # noqa: E402
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import invoice_generator  # noqa: E402
+import simple_server  # noqa: E402
+
+FIELDS = ["invoice_number", "date", "vendor", "total"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def time_stage(func, inputs, repeat):
+    """Milliseconds per call over every input, and the tracemalloc peak in bytes."""
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        for value in inputs:
+            started = time.perf_counter()
+            func(value)
+            timings.append((time.perf_counter() - started) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak
+
+
+def item_accuracy(items, truth_items):
+    """Share of ground-truth rows whose amount appears (once) among the extracted items."""
+    if not truth_items:
+        return 1.0
+    remaining = [item.get("amount") for item in items if isinstance(item.get("amount"), (int, float))]
+    matched = 0
+    for truth in truth_items:
+        for i, amount in enumerate(remaining):
+            if abs(amount - truth["amount"]) < 0.01:
+                matched += 1
+                del remaining[i]
+                break
+    return matched / len(truth_items)
+
+
+async def run_uploads(documents, concurrency):
+    """POST every document to /upload; returns ``(results, wall seconds)``."""
+    limit = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with simple_server.lifespan(simple_server.app):
+        # Measure warm workers, as a replica would be once /ready passes
+        while not simple_server._warmup["done"]:
+            await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=simple_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def upload(kind, filename, content_type, data, truth):
+                async with limit:
+                    started = time.perf_counter()
+                    response = await client.post("/upload", files={"file": (filename, data, content_type)})
+                    elapsed = (time.perf_counter() - started) * 1000
+                results.append((kind, truth, response.json(), elapsed))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(upload(*document) for document in documents))
+            wall = time.perf_counter() - started
+    return results, wall
+
+
+def print_latency_table(stages):
+    print(f"\n{'stage':<34} {'n':>5} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak heap MB':>13}")
+    for name, (timings, peak) in stages.items():
+        if not timings:
+            continue
+        peak_text = f"{peak / 2**20:>13.1f}" if peak is not None else f"{'-':>13}"
+        print(f"{name:<34} {len(timings):>5} {percentile(timings, 50):>9.1f} {percentile(timings, 90):>9.1f} "
+              f"{percentile(timings, 99):>9.1f} {peak_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10, help="invoices per kind")
+    parser.add_argument("--kinds", nargs="+", default=["digital", "scanned", "png"], choices=["digital", "scanned", "png"])
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--rotation", type=float, default=0.0)
+    parser.add_argument("--blur", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=3, help="repeats for the in-process stages")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="also write the raw numbers here")
+    args = parser.parse_args()
+
+    documents = []
+    for seed in range(args.docs):
+        for kind in args.kinds:
+            filename, content_type, data, truth = invoice_generator.generate(
+                kind, seed, args.items, args.pages, args.noise, args.rotation, args.blur)
+            documents.append((kind, filename, content_type, data, truth))
+    print(f"Generated {len(documents)} invoices ({args.items} items, {args.pages} page(s), noise {args.noise}, "
+          f"rotation ±{args.rotation}°, blur {args.blur})")
+    print(f"Tesseract: {'available' if simple_server.TESSERACT_AVAILABLE else 'not available (OCR stages skipped)'}; "
+          f"OCR workers: {simple_server.OCR_WORKERS}")
+
+    stages = {}
+    texts = []
+    for kind, _, _, data, _ in documents:
+        if kind == "digital":
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                texts.append("".join(page.get_text() for page in doc))
+    if texts:
+        stages["parse_invoice_text"] = time_stage(lambda text: simple_server.parse_invoice_text(text, "bench.pdf"), texts, args.repeat)
+
+    images = []
+    for kind, _, _, data, _ in documents:
+        if kind == "png":
+            image = Image.open(BytesIO(data))
+            image.load()
+            images.append(image)
+    if images:
+        stages["preprocess_image"] = time_stage(simple_server.preprocess_image, images, args.repeat)
+        if simple_server.TESSERACT_AVAILABLE:
+            stages["extract_items_from_image"] = time_stage(simple_server.extract_items_from_image, images, 1)
+
+    results, wall = asyncio.run(run_uploads(documents, args.concurrency))
+    stages["upload (end to end)"] = ([elapsed for *_, elapsed in results], None)
+    server_steps = {}
+    for _, _, payload, _ in results:
+        for step, elapsed in (payload.get("timings_ms") or {}).items():
+            server_steps.setdefault(f"  upload: {step}", []).append(elapsed)
+    for step, timings in sorted(server_steps.items()):
+        stages[step] = (timings, None)
+
+    print_latency_table(stages)
+    print(f"\n/upload throughput: {len(results) / wall:.2f} docs/sec ({len(results)} docs in {wall:.2f} s, concurrency {args.concurrency})")
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"Peak RSS: server {self_rss:.0f} MB, largest finished OCR worker {child_rss:.0f} MB")
+
+    accuracy = {}
+    print(f"\n{'kind':<9} {'docs':>5} " + " ".join(f"{field:>15}" for field in FIELDS) + f" {'items':>7} {'status ok':>10}")
+    for kind in args.kinds:
+        rows = [(truth, payload) for doc_kind, truth, payload, _ in results if doc_kind == kind]
+        if not rows:
+            continue
+        scores = {field: sum(payload["extracted_data"].get(field) == truth[field] for truth, payload in rows) / len(rows)
+                  for field in FIELDS}
+        scores["items"] = sum(item_accuracy(payload["extracted_data"].get("items") or [], truth["items"])
+                              for truth, payload in rows) / len(rows)
+        scores["status_ok"] = sum(payload.get("status") == "success" for _, payload in rows) / len(rows)
+        accuracy[kind] = scores
+        print(f"{kind:<9} {len(rows):>5} " + " ".join(f"{scores[field]:>15.0%}" for field in FIELDS)
+              + f" {scores['items']:>7.0%} {scores['status_ok']:>10.0%}")
+
+    if args.json:
+        report = {
+            "config": vars(args) | {"json": str(args.json)},
+            "stages": {name: {"n": len(timings), "p50_ms": percentile(timings, 50), "p90_ms": percentile(timings, 90),
+                              "p99_ms": percentile(timings, 99), "peak_heap_bytes": peak}
+                       for name, (timings, peak) in stages.items() if timings},
+            "docs_per_sec": len(results) / wall,
+            "peak_rss_mb": {"server": self_rss, "ocr_worker": child_rss},
+            "accuracy": accuracy,
+        }
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
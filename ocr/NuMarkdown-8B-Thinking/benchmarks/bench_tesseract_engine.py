@@ -0,0 +1,77 @@
+"""
+Per-call latency of the tesseract binary (pytesseract: temp file, fork, model
+load, TSV parse) against warm in-process engines (tesserocr via TesseractEnginePool).
+
+Small images are where per-call startup dominates: ROI field lines and table
+bands are a few hundred pixels tall, a page render is thousands.
+
+    python benchmarks/bench_tesseract_engine.py --repeat 10
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import simple_server  # noqa: E402
+from tesseract_engine import TESSEROCR_AVAILABLE, TesseractEnginePool  # noqa: E402
+
+LINES = [
+    "Invoice No.: 398    Date: 16-11-2024",
+    "1  Steel bolt M8  10 nos  45.00  18%  531.00",
+    "2  Hex nut M8  25 nos  4.00  18%  118.00",
+    "Grand Total  Rs. 649.00",
+]
+
+
+def synthetic_image(width: int, lines: int):
+    img = Image.new("L", (width, 40 + lines * 36), 255)
+    draw = ImageDraw.Draw(img)
+    for i in range(lines):
+        draw.text((20, 20 + i * 36), LINES[i % len(LINES)], fill=0)
+    return img.resize((img.width * 2, img.height * 2))
+
+
+def measure(func, image, config, repeat):
+    func(image, config)  # first call pays for engine creation
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(image, config)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    engines = []
+    if simple_server.PYTESSERACT_AVAILABLE:
+        engines.append(("binary", lambda image, config: simple_server.tesseract_binary().image_to_data(
+            image, output_type=simple_server.pytesseract.Output.DICT, config=config)))
+    if TESSEROCR_AVAILABLE:
+        pool = TesseractEnginePool.from_env()
+        engines.append(("in-process", pool.image_to_data))
+    if not engines:
+        print("Neither the tesseract binary nor tesserocr is available.")
+        return
+
+    cases = [
+        ("ROI line", synthetic_image(400, 1), simple_server.OCR_ROI_CONFIG),
+        ("table band", synthetic_image(700, 12), simple_server.OCR_TABLE_CONFIG),
+        ("page", synthetic_image(1240, 45), simple_server.TESSERACT_CONFIG),
+    ]
+    print(f"{'case':<11} {'size':>11} " + " ".join(f"{name + ' ms':>14}" for name, _ in engines))
+    for label, image, config in cases:
+        results = [measure(func, image, config, args.repeat) for _, func in engines]
+        print(f"{label:<11} {image.width:>5}x{image.height:<5} " + " ".join(f"{ms:>14.1f}" for ms in results))
+
+
+if __name__ == "__main__":
+    main()
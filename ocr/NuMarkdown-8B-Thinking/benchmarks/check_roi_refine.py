@@ -0,0 +1,40 @@
+"""
+Check of the rule that decides when a re-OCRed field line replaces the page
+OCR's reading of it (reread_replaces_line). Runs on synthetic ``(text, conf)``
+lines, so Tesseract is not needed. Exits non-zero when a case is decided wrongly.
+
+    python benchmarks/check_roi_refine.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import simple_server  # noqa: E402
+
+ORIGINAL = [("Grand", 96), ("Total", 96), ("Rs.", 90), ("8370395", 40)]
+
+# (description, re-read words, expected decision)
+CASES = [
+    ("re-read drops the amount", [("Grand", 95), ("Total", 95), ("Rs.", 95)], False),
+    ("re-read turns the amount into letters", [("Grand", 97), ("Total", 97), ("Rs.", 95), ("BETOB", 90)], False),
+    ("re-read is less confident", [("Grand", 90), ("Total", 90), ("Rs.", 80), ("83,703.95", 35)], False),
+    ("re-read recovers the amount", [("Grand", 96), ("Total", 96), ("Rs.", 93), ("83,703.95", 91)], True),
+    ("re-read splits the amount", [("Grand", 96), ("Total", 96), ("Rs.", 93), ("83,703", 88), (".95", 85)], True),
+    ("re-read is empty", [], False),
+]
+
+
+def main():
+    failures = 0
+    for description, reread, expected in CASES:
+        accepted = simple_server.reread_replaces_line(ORIGINAL, reread)
+        if accepted != expected:
+            failures += 1
+        print(f"{'ok  ' if accepted == expected else 'FAIL'} {description}: {'accepted' if accepted else 'rejected'}")
+    print(f"{len(CASES) - failures}/{len(CASES)} cases decided as expected")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
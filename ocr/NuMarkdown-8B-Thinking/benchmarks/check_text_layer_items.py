@@ -0,0 +1,71 @@
+"""
+Regression check for line items read from PDF text layers.
+
+Generates digital invoices (see invoice_generator.py), whose table cells are
+each a separate text object, runs them through read_pdf_text_layers and
+compares the first page's items with the ground truth. Exits non-zero when
+any invoice comes back with missing or wrong rows.
+
+    python benchmarks/check_text_layer_items.py --docs 50 --items 1 8 28
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import invoice_generator  # noqa: E402
+import simple_server  # noqa: E402
+
+COMPARED_FIELDS = ("index", "description", "quantity", "unit", "rate", "amount")
+
+
+def item_differences(items, truth_items):
+    """Human-readable differences between extracted and expected rows; empty when they match."""
+    differences = []
+    if len(items) != len(truth_items):
+        differences.append(f"{len(items)} rows, expected {len(truth_items)}")
+    for row, (item, truth) in enumerate(zip(items, truth_items), start=1):
+        for field in COMPARED_FIELDS:
+            got, expected = item.get(field), truth[field]
+            same = abs(got - expected) < 0.005 if isinstance(expected, float) and isinstance(got, (int, float)) else got == expected
+            if not same:
+                differences.append(f"row {row} {field}: {got!r}, expected {expected!r}")
+    return differences
+
+
+def check_invoice(seed: int, items: int, pages: int):
+    _, _, data, truth = invoice_generator.generate("digital", seed, items, pages)
+    rows_per_page = max(1, min(invoice_generator.ROWS_PER_PAGE, -(-items // pages)))
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf:
+        pdf.write(data)
+        pdf.flush()
+        layers = simple_server.read_pdf_text_layers(pdf.name)
+    if layers[0]["needs_ocr"]:
+        return ["page 1 was sent to OCR instead of using its text layer"]
+    return item_differences(layers[0]["items"], truth["items"][:rows_per_page])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="invoices per item count")
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 8, 28])
+    parser.add_argument("--pages", type=int, default=1)
+    args = parser.parse_args()
+
+    failures = 0
+    for items in args.items:
+        for seed in range(args.docs):
+            differences = check_invoice(seed, items, args.pages)
+            if differences:
+                failures += 1
+                print(f"invoice seed {seed}, {items} items: " + "; ".join(differences[:5]))
+    total = args.docs * len(args.items)
+    print(f"{total - failures}/{total} invoices matched their ground-truth items")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
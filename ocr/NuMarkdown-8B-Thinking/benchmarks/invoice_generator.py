@@ -0,0 +1,198 @@
+"""
+Synthetic GST invoices with known ground truth, for benchmarks.
+
+Every invoice is laid out once as a digital PDF (real text layer) and can be
+turned into a scanned-style PDF (raster pages only) or a PNG of its first
+page, with optional noise, blur and rotation.
+
+    python benchmarks/invoice_generator.py out/ --count 10 --items 12 --pages 2 --noise 0.03 --rotation 1.5
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
+
+import fitz
+from PIL import Image, ImageFilter
+
+VENDORS = ["Shree Ganesh Traders", "Patel Hardware Stores", "Sunrise Industrial Supplies",
+           "Metro Fasteners Pvt Ltd", "Kaveri Electricals", "Bharat Packaging Co"]
+PRODUCTS = ["Steel bolt M8", "Hex nut M10", "PVC pipe 1in", "Copper wire 2.5mm", "Ball bearing 6204",
+            "Cable tie 200mm", "Paint primer 1L", "Masking tape", "Drill bit 8mm", "Safety gloves",
+            "LED tube 20W", "Corrugated box", "Grease 500g", "Wall plug 6mm", "Hose clamp"]
+UNITS = ["nos", "pcs", "box", "set", "roll"]
+GST_RATES = [5, 12, 18, 28]
+COLUMNS = [("#", 40), ("Item", 70), ("Qty", 300), ("Unit", 350), ("Rate", 400), ("GST", 465), ("Amount", 510)]
+ROWS_PER_PAGE = 28
+
+
+def make_invoice(seed: int, items: int = 8):
+    """Random invoice fields plus the ground truth parse_invoice_text should produce."""
+    rng = random.Random(seed)
+    issued = date(2024, 1, 1) + timedelta(days=rng.randint(0, 364))
+    gst_rate = rng.choice(GST_RATES)
+    lines = []
+    for index in range(1, items + 1):
+        quantity = rng.randint(1, 60)
+        rate = round(rng.uniform(5, 900), 2)
+        lines.append({
+            "index": str(index),
+            "description": rng.choice(PRODUCTS),
+            "quantity": float(quantity),
+            "unit": rng.choice(UNITS),
+            "rate": rate,
+            "amount": round(quantity * rate, 2),
+        })
+    subtotal = round(sum(line["amount"] for line in lines), 2)
+    tax = round(subtotal * gst_rate / 100, 2)
+    number = rng.randint(100, 99999)
+    return {
+        "seed": seed,
+        "vendor": rng.choice(VENDORS),
+        "invoice_number": f"INV-{number}",
+        "number": number,
+        "date": issued.isoformat(),
+        "printed_date": issued.strftime("%d-%m-%Y"),
+        "gst_rate": gst_rate,
+        "gstin": f"{rng.randint(10, 37)}ABCDE{rng.randint(1000, 9999)}F1Z{rng.randint(1, 9)}",
+        "items": lines,
+        "subtotal": subtotal,
+        "tax": tax,
+        "total": f"₹{subtotal + tax:.2f}",
+    }
+
+
+def render_digital_pdf(invoice, pages: int = 1) -> bytes:
+    """Lay the invoice out over ``pages`` A4 pages (more if the items need them)."""
+    doc = fitz.open()
+    rows_per_page = max(1, min(ROWS_PER_PAGE, -(-len(invoice["items"]) // max(1, pages))))
+    chunks = [invoice["items"][i:i + rows_per_page] for i in range(0, len(invoice["items"]), rows_per_page)] or [[]]
+    while len(chunks) < pages:
+        chunks.append([])
+    for page_num, chunk in enumerate(chunks):
+        page = doc.new_page()
+        y = 60
+        if page_num == 0:
+            page.insert_text((40, y), invoice["vendor"], fontsize=16)
+            page.insert_text((40, y + 22), f"GSTIN: {invoice['gstin']}", fontsize=10)
+            page.insert_text((380, y), "TAX INVOICE", fontsize=14)
+            page.insert_text((380, y + 22), f"Invoice No.: {invoice['number']}", fontsize=10)
+            page.insert_text((380, y + 38), f"Date: {invoice['printed_date']}", fontsize=10)
+            y += 80
+        if chunk:
+            for label, x in COLUMNS:
+                page.insert_text((x, y), label, fontsize=10)
+            y += 20
+            for line in chunk:
+                cells = [line["index"], line["description"], f"{line['quantity']:g}", line["unit"],
+                         f"{line['rate']:.2f}", f"{invoice['gst_rate']}%", f"{line['amount']:.2f}"]
+                for (_, x), cell in zip(COLUMNS, cells):
+                    page.insert_text((x, y), cell, fontsize=10)
+                y += 18
+        if page_num == len(chunks) - 1:
+            half = invoice["gst_rate"] / 2
+            y += 12
+            page.insert_text((380, y), f"Sub Total  {invoice['subtotal']:.2f}", fontsize=10)
+            page.insert_text((380, y + 16), f"CGST {half:g}%  {invoice['tax'] / 2:.2f}", fontsize=10)
+            page.insert_text((380, y + 32), f"SGST {half:g}%  {invoice['tax'] / 2:.2f}", fontsize=10)
+            page.insert_text((380, y + 52), f"Grand Total  Rs. {invoice['total'][1:]}", fontsize=12)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def degrade(image: "Image.Image", rng: random.Random, noise: float = 0.0, rotation: float = 0.0, blur: float = 0.0):
+    """Scanner artefacts: salt-and-pepper ``noise`` (fraction of pixels), blur radius and skew in degrees."""
+    image = image.convert("L")
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = image.load()
+        for _ in range(int(image.width * image.height * noise)):
+            pixels[rng.randrange(image.width), rng.randrange(image.height)] = rng.choice((0, 255))
+    if rotation:
+        image = image.rotate(rng.uniform(-rotation, rotation), resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    return image
+
+
+def rasterize(pdf_bytes: bytes, dpi: int, rng: random.Random, **artefacts):
+    images = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+            image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+            images.append(degrade(image, rng, **artefacts))
+    return images
+
+
+def render_scanned_pdf(pdf_bytes: bytes, rng: random.Random, dpi: int = 200, **artefacts) -> bytes:
+    """The digital PDF printed and scanned: raster pages only, no text layer."""
+    doc = fitz.open()
+    for image in rasterize(pdf_bytes, dpi, rng, **artefacts):
+        buffer = image_bytes(image, "PNG")
+        page = doc.new_page(width=image.width * 72 / dpi, height=image.height * 72 / dpi)
+        page.insert_image(page.rect, stream=buffer)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def render_png(pdf_bytes: bytes, rng: random.Random, dpi: int = 200, **artefacts) -> bytes:
+    """First page as a phone-photo/scanner PNG."""
+    return image_bytes(rasterize(pdf_bytes, dpi, rng, **artefacts)[0], "PNG")
+
+
+def image_bytes(image, fmt: str) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def generate(kind: str, seed: int, items: int = 8, pages: int = 1, noise: float = 0.0, rotation: float = 0.0, blur: float = 0.0):
+    """
+    Returns ``(filename, content_type, data, truth)`` for one invoice of ``kind``
+    (``digital``, ``scanned`` or ``png``). A PNG holds only the first page, so its
+    ground-truth items are that page's rows.
+    """
+    invoice = make_invoice(seed, items)
+    rng = random.Random(seed + 1)
+    artefacts = {"noise": noise, "rotation": rotation, "blur": blur}
+    if kind == "digital":
+        return f"invoice-{seed}.pdf", "application/pdf", render_digital_pdf(invoice, pages), invoice
+    if kind == "scanned":
+        return f"invoice-{seed}-scan.pdf", "application/pdf", render_scanned_pdf(render_digital_pdf(invoice, pages), rng, **artefacts), invoice
+    if kind == "png":
+        truth = dict(invoice)
+        if pages > 1:
+            rows_per_page = max(1, min(ROWS_PER_PAGE, -(-len(invoice["items"]) // pages)))
+            truth["items"] = invoice["items"][:rows_per_page]
+        return f"invoice-{seed}.png", "image/png", render_png(render_digital_pdf(invoice, pages), rng, **artefacts), truth
+    raise ValueError(f"Unknown invoice kind: {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--kinds", nargs="+", default=["digital", "scanned", "png"], choices=["digital", "scanned", "png"])
+    parser.add_argument("--items", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--rotation", type=float, default=0.0)
+    parser.add_argument("--blur", type=float, default=0.0)
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    for seed in range(args.count):
+        for kind in args.kinds:
+            filename, _, data, truth = generate(kind, seed, args.items, args.pages, args.noise, args.rotation, args.blur)
+            (args.out / filename).write_bytes(data)
+            (args.out / f"{filename}.json").write_text(json.dumps(truth, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Wrote {args.count * len(args.kinds)} invoices to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
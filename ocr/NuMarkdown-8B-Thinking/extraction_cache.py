@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def hash_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache for extraction results, shared by simple_server and app.py.
+
+    Keys are ``<content sha256>-<params digest>`` so every result computed for one
+    document can be invalidated together. Values must be JSON-serializable. The
+    memory tier is an LRU bounded by the JSON size of its values; the disk tier
+    stores one JSON file per key and survives restarts. Disk-tier calls block on
+    file I/O, so async callers run them in a thread (``asyncio.to_thread``).
+    """
+
+    def __init__(self, directory=None, max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=1024 * 1024 * 1024):
+        self.directory = Path(directory) if directory else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        # Serializes directory scans and evictions, which run outside ``_lock``
+        self._scan_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, namespace: str):
+        """Build a cache from OCR_CACHE_DIR / OCR_CACHE_MEMORY_MB / OCR_CACHE_DISK_MB."""
+        base_dir = os.environ.get("OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "invoice-ocr"))
+        memory_mb = float(os.environ.get("OCR_CACHE_MEMORY_MB", "64"))
+        disk_mb = float(os.environ.get("OCR_CACHE_DISK_MB", "1024"))
+        directory = os.path.join(base_dir, namespace) if base_dir and disk_mb > 0 else None
+        return cls(directory, int(memory_mb * 1024 * 1024), int(disk_mb * 1024 * 1024))
+
+    @staticmethod
+    def make_key(content_hash: str, **params) -> str:
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"{content_hash}-{digest}"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._memory[key][0]
+
+        if self.directory:
+            path = self._path(key)
+            try:
+                raw = path.read_text(encoding="utf-8")
+                value = json.loads(raw)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, value, len(raw))
+                return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value):
+        raw = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._stats["stores"] += 1
+            self._remember(key, value, len(raw))
+
+        if self.directory:
+            path = self._path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(raw, encoding="utf-8")
+                os.replace(tmp_path, path)
+                self._track_disk_write(len(raw.encode("utf-8")))
+            except OSError as e:
+                print(f"Error writing extraction cache entry: {e}")
+
+    def _remember(self, key: str, value, size: int):
+        # Caller holds the lock
+        if size > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def _disk_entries(self):
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _track_disk_write(self, size: int):
+        # Only rescan the directory when the running estimate is unknown or crosses the limit
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
+        # Scans take seconds on a large tier; memory hits in other threads must not wait on them
+        with self._scan_lock:
+            entries = self._disk_entries()
+            total = sum(entry_size for _, entry_size, _ in entries)
+            evicted = 0
+            if total > self.max_disk_bytes:
+                for _, entry_size, path in sorted(entries):
+                    if total <= self.max_disk_bytes * 0.9:
+                        break
+                    try:
+                        path.unlink()
+                    except OSError:
+                        continue
+                    total -= entry_size
+                    evicted += 1
+            with self._lock:
+                self._disk_bytes = total
+                self._stats["evictions"] += evicted
+
+    def invalidate(self, content_hash: str = None) -> int:
+        """Drop every entry for ``content_hash``, or the whole cache when omitted."""
+        prefix = f"{content_hash}-" if content_hash else ""
+        removed = set()
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                self._memory_bytes -= self._memory.pop(key)[1]
+                removed.add(key)
+        if self.directory:
+            pattern = f"{content_hash[:2]}/{prefix}*.json" if content_hash else "*/*.json"
+            for path in self.directory.glob(pattern):
+                try:
+                    path.unlink()
+                    removed.add(path.stem)
+                except OSError:
+                    pass
+        with self._lock:
+            self._stats["invalidations"] += 1
+            self._disk_bytes = None
+        return len(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        if self.directory:
+            entries = self._disk_entries()
+            stats["disk_entries"] = len(entries)
+            stats["disk_bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight work: callers that arrive with a key that is
+    already running attach to that computation instead of starting another.
+    Keys are normally ExtractionCache keys. The work is cancelled only when
+    every caller attached to it has gone. Use from one event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    @contextmanager
+    def join(self, key: str, start):
+        """
+        Yield ``(work, shared)`` for ``key``, calling ``start()`` when nothing is
+        in flight. ``start`` returns a future (or an object with ``done``,
+        ``cancel`` and ``add_done_callback``); ``shared`` is True for callers
+        that attached to someone else's work.
+        """
+        entry = self._calls.get(key)
+        shared = entry is not None
+        if entry is None:
+            entry = self._calls[key] = [start(), 0]
+            entry[0].add_done_callback(lambda done: self._forget(key, entry, done))
+        else:
+            self.coalesced += 1
+        entry[1] += 1
+        try:
+            yield entry[0], shared
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+
+    async def run(self, key: str, func, *args):
+        """Await ``func(*args)`` or the identical call already in flight. Returns ``(result, shared)``."""
+        with self.join(key, lambda: asyncio.ensure_future(func(*args))) as (task, shared):
+            return await asyncio.shield(task), shared
+
+    def _forget(self, key, entry, done):
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+        # Mark the outcome as retrieved; callers that still wait have already seen it
+        if not done.cancelled():
+            done.exception()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,59 @@
+import importlib.util
+import sys
+import threading
+import types
+
+
+class _LockedLazyModule(types.ModuleType):
+    """
+    A lazily loaded module that runs its code under a lock on first attribute
+    access. importlib's own _LazyModule (before Python 3.12.3) turns back into a
+    plain module before running the code, so a second thread can see it half
+    initialised ("module 'fitz' has no attribute 'open'").
+    """
+
+    def __getattribute__(self, attr):
+        spec = object.__getattribute__(self, "__spec__")
+        state = spec.loader_state
+        with state["lock"]:
+            # The loading thread itself reads the module while its code runs
+            if object.__getattribute__(self, "__class__") is _LockedLazyModule and not state["loading"]:
+                state["loading"] = True
+                try:
+                    spec.loader.exec_module(self)
+                finally:
+                    state["loading"] = False
+                self.__class__ = types.ModuleType
+        return types.ModuleType.__getattribute__(self, attr)
+
+
+def lazy_import(name: str):
+    """
+    Return module ``name`` without running it until one of its attributes is
+    first used (importlib's LazyLoader, loading under a lock so threads can
+    share it), or None when it is not installed. Processes and code paths that
+    never touch a heavy dependency then never pay for importing it.
+    Pure-Python packages only: extension modules initialise as soon as they
+    are created.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # LazyLoader has put the real loader back on the spec
+    spec.loader_state.update(lock=threading.RLock(), loading=False)
+    module.__class__ = _LockedLazyModule
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -0,0 +1,173 @@
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# The profile of the request being served, if it is being profiled; asyncio tasks inherit it
+ACTIVE_PROFILE = contextvars.ContextVar("active_profile", default=None)
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{1,64}-[0-9a-f]{6}$')
+
+
+class _StatsHolder:
+    """Lets pstats load raw ``stats`` dicts shipped back from pool workers."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profiled_call(func, *args):
+    """Run ``func(*args)`` under cProfile (in a pool worker); returns ``(result, raw stats)``."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+class RequestProfile:
+    """
+    cProfile data for one request, gathered from the event loop process
+    (synchronous sections wrapped with ``section``) and from every pool worker
+    call it made.
+    """
+
+    def __init__(self, trigger: str):
+        self.trigger = trigger
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def add_stats(self, raw_stats):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(_StatsHolder(raw_stats))
+            else:
+                self._stats.add(_StatsHolder(raw_stats))
+
+    def section(self, func, *args, **kwargs):
+        """Call ``func`` under a profiler of its own; the call must not await."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this thread; run unprofiled
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            self.add_stats(profiler.stats)
+
+    def dump(self, path):
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(str(path))
+                return True
+        return False
+
+
+def run_profiled(func, *args, **kwargs):
+    """Call ``func`` inside the active request profile, or plainly when there is none."""
+    profile = ACTIVE_PROFILE.get()
+    if profile is None:
+        return func(*args, **kwargs)
+    return profile.section(func, *args, **kwargs)
+
+
+class ProfileRing:
+    """
+    Bounded on-disk ring of request profiles. Each entry is ``<id>.prof``
+    (pstats format: ``python -m pstats``, snakeviz, flameprof) and ``<id>.json``
+    with the input's sha256 and request details, plus ``<id>.input`` when inputs
+    are kept. The oldest entries are removed beyond ``max_entries``.
+    """
+
+    def __init__(self, directory, max_entries: int = 50, keep_inputs: bool = False):
+        self.directory = Path(directory)
+        self.max_entries = max(1, max_entries)
+        self.keep_inputs = keep_inputs
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a ring from OCR_PROFILE_DIR / OCR_PROFILE_MAX_FILES / OCR_PROFILE_KEEP_INPUT."""
+        directory = os.environ.get("OCR_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "invoice-ocr-profiles")
+        return cls(directory, int(os.environ.get("OCR_PROFILE_MAX_FILES", "50")), os.environ.get("OCR_PROFILE_KEEP_INPUT", "0") == "1")
+
+    def save(self, profile: RequestProfile, content_hash: str, source=None, **details):
+        """
+        Write one entry and trim the ring; returns its id, or None when nothing
+        was profiled. ``source`` is the input, as a path or a seekable binary file.
+        """
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{content_hash[:16]}-{os.urandom(3).hex()}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not profile.dump(self.directory / f"{profile_id}.prof"):
+            return None
+        meta = {"id": profile_id, "sha256": content_hash, "trigger": profile.trigger, "created": time.time(), **details}
+        if self.keep_inputs and source is not None:
+            if isinstance(source, (str, os.PathLike)):
+                shutil.copyfile(source, self.directory / f"{profile_id}.input")
+            else:
+                source.seek(0)
+                with open(self.directory / f"{profile_id}.input", "wb") as kept:
+                    shutil.copyfileobj(source, kept)
+            meta["input_kept"] = True
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding="utf-8")
+        self._trim()
+        return profile_id
+
+    def _trim(self):
+        with self._lock:
+            entries = sorted(self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime)
+            for meta_path in entries[:max(0, len(entries) - self.max_entries)]:
+                for suffix in (".json", ".prof", ".input"):
+                    try:
+                        meta_path.with_suffix(suffix).unlink()
+                    except OSError:
+                        pass
+
+    def list(self):
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            try:
+                entries.append(json.loads(meta_path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return sorted(entries, key=lambda entry: entry.get("created", 0), reverse=True)
+
+    def path(self, profile_id: str, suffix: str):
+        """Path of an entry's ``.prof``/``.input`` file, or None for unknown or malformed ids."""
+        if not PROFILE_ID_PATTERN.match(profile_id or ""):
+            return None
+        path = self.directory / f"{profile_id}{suffix}"
+        return path if path.is_file() else None
+
+
+def choose_trigger(requested: bool, sample_rate: float, slow_ms: float):
+    """
+    Why the coming request should be profiled (``header``, ``sample`` or
+    ``slow``), or None. ``slow`` profiles are only kept when the request
+    ends up slower than ``slow_ms``.
+    """
+    if requested:
+        return "header"
+    if sample_rate > 0 and random.random() < sample_rate:
+        return "sample"
+    if slow_ms > 0:
+        return "slow"
+    return None
@@ -1,31 +1,47 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, File, Header, Request, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import List
+import asyncio
 import uvicorn
 import re
-import io
 import os
+import base64
+import bisect
+import json
+import time
 import shutil
+import hashlib
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from io import BytesIO
 from pathlib import Path
 
-try:
-    import fitz  # PyMuPDF
-    PYMUPDF_AVAILABLE = True
-except ImportError:
-    PYMUPDF_AVAILABLE = False
-
-try:
-    from PIL import Image, ImageOps, ImageFilter
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-
-try:
-    import pytesseract
-    from pytesseract import Output
-    TESSERACT_AVAILABLE = True
-except ImportError:
-    TESSERACT_AVAILABLE = False
+from extraction_cache import ExtractionCache, SingleFlight
+from lazy_import import lazy_import
+from metrics import MetricsRegistry, server_timing_header
+from request_profiler import ACTIVE_PROFILE, ProfileRing, RequestProfile, choose_trigger, profiled_call, run_profiled
+from tesseract_engine import TESSEROCR_AVAILABLE, TesseractEnginePool
+
+# Heavy dependencies load on first use, so startup and processes that never OCR skip them
+np = lazy_import("numpy")
+NUMPY_AVAILABLE = np is not None
+
+fitz = lazy_import("fitz")  # PyMuPDF
+PYMUPDF_AVAILABLE = fitz is not None
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+ImageFilter = lazy_import("PIL.ImageFilter")
+PIL_AVAILABLE = None not in (Image, ImageOps, ImageFilter)
+
+pytesseract = lazy_import("pytesseract")
+TESSERACT_AVAILABLE = pytesseract is not None
 
 
 def resolve_tesseract_cmd():
@@ -50,40 +66,734 @@ def resolve_tesseract_cmd():
     return None
 
 
+# A PATH lookup; pytesseract itself is only imported and pointed at it by tesseract_binary()
 TESSERACT_CMD = resolve_tesseract_cmd() if TESSERACT_AVAILABLE else None
-if TESSERACT_AVAILABLE and TESSERACT_CMD:
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
-else:
+if not TESSERACT_CMD:
     TESSERACT_AVAILABLE = False
 
+# "auto" uses warm in-process engines (tesserocr) when installed, else the tesseract binary.
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "auto")
+USE_TESSEROCR = TESSEROCR_AVAILABLE and OCR_ENGINE in ("auto", "tesserocr")
+PYTESSERACT_AVAILABLE = TESSERACT_AVAILABLE
+TESSERACT_AVAILABLE = PYTESSERACT_AVAILABLE or USE_TESSEROCR
+
 TESSERACT_CONFIG = os.environ.get("TESSERACT_CONFIG", "--oem 1 --psm 6")
+# Lines holding invoice fields whose weakest word is below OCR_FIELD_MIN_CONF are
+# re-OCRed on their own at OCR_ROI_SCALE times the resolution as a single text line,
+# at most OCR_ROI_MAX_REGIONS per page (each one is a Tesseract call).
+OCR_ROI_REFINE = os.environ.get("OCR_ROI_REFINE", "1") != "0"
+OCR_FIELD_MIN_CONF = float(os.environ.get("OCR_FIELD_MIN_CONF", "70"))
+OCR_ROI_SCALE = float(os.environ.get("OCR_ROI_SCALE", "2"))
+OCR_ROI_MAX_REGIONS = int(os.environ.get("OCR_ROI_MAX_REGIONS", "4"))
+OCR_ROI_CONFIG = os.environ.get("OCR_ROI_CONFIG", "--oem 1 --psm 7")
+# Opt-in two-pass item OCR: a coarse pass at 1/OCR_TABLE_COARSE_FACTOR resolution reads the
+# page and locates the item table, then only that band is OCRed at full resolution.
+OCR_TABLE_BAND = os.environ.get("OCR_TABLE_BAND", "0") == "1"
+OCR_TABLE_COARSE_FACTOR = max(1, int(os.environ.get("OCR_TABLE_COARSE_FACTOR", "2")))
+OCR_TABLE_CONFIG = os.environ.get("OCR_TABLE_CONFIG", "--oem 1 --psm 6 -c preserve_interword_spaces=1")
+
+# CPU-bound extraction runs in a process pool so one scanned PDF can't block the event loop.
+OCR_WORKERS = max(1, int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1)))
+# Documents allowed in flight (running + waiting for a worker) before /upload answers 429.
+OCR_MAX_PENDING = max(1, int(os.environ.get("OCR_MAX_PENDING", OCR_WORKERS * 4)))
+OCR_RETRY_AFTER = int(os.environ.get("OCR_RETRY_AFTER", "5"))
+# Start and warm every OCR worker at startup; /ready reports 503 until that is done
+OCR_WARMUP = os.environ.get("OCR_WARMUP", "1") != "0"
+# Upper bound on documents accepted by one /upload/batch request (ZIP members included).
+OCR_BATCH_MAX_FILES = int(os.environ.get("OCR_BATCH_MAX_FILES", "5000"))
+# Upper bound on the bytes one batch may spool (files plus decompressed ZIP members), and
+# on a large ZIP member's compression ratio, so a small ZIP bomb can't fill the spool dir.
+OCR_BATCH_MAX_BYTES = int(float(os.environ.get("OCR_BATCH_MAX_MB", "2048")) * 1024 * 1024)
+OCR_ZIP_MAX_RATIO = float(os.environ.get("OCR_ZIP_MAX_RATIO", "100"))
+
+# Uploads are streamed to spool files on disk instead of being held in memory.
+OCR_MAX_UPLOAD_BYTES = int(float(os.environ.get("OCR_MAX_UPLOAD_MB", "100")) * 1024 * 1024)
+OCR_SPOOL_DIR = os.environ.get("OCR_SPOOL_DIR") or None
+OCR_SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Bump when parsing/layout output changes so cached extractions are not reused across versions.
+PARSER_VERSION = "v8-visual-rows"
+EXTRACTION_CACHE = ExtractionCache.from_env("simple_server")
+OCR_IN_FLIGHT = SingleFlight()
+# Shared secret for /cache admin endpoints; they stay disabled while unset.
+OCR_ADMIN_TOKEN = os.environ.get("OCR_ADMIN_TOKEN", "")
+
+# Request profiling (cProfile across the event loop and pool workers), triggered by
+# "X-Profile: 1" with the admin token, by sampling, or kept when an upload is slower
+# than OCR_PROFILE_SLOW_MS (which profiles every upload, at some CPU cost)
+OCR_PROFILE_SAMPLE_RATE = float(os.environ.get("OCR_PROFILE_SAMPLE_RATE", "0"))
+OCR_PROFILE_SLOW_MS = float(os.environ.get("OCR_PROFILE_SLOW_MS", "0"))
+PROFILE_RING = ProfileRing.from_env()
+
+# A PDF page whose text layer is empty or mostly garbage is rasterized and OCRed, and so is a
+# page with images whose layer is shorter than this (a scan with a stamp typed over it).
+PDF_TEXT_MIN_CHARS = int(os.environ.get("PDF_TEXT_MIN_CHARS", "50"))
+PDF_OCR_DPI = int(os.environ.get("PDF_OCR_DPI", "300"))
+# Cap on pages of one PDF OCRed concurrently, so a long scan can't occupy every worker.
+OCR_MAX_PAGES_PER_DOC = max(1, int(os.environ.get("OCR_MAX_PAGES_PER_DOC", max(1, OCR_WORKERS // 2))))
+
+# Confidence router: extractions scoring below the threshold are redone by NuMarkdown on vLLM.
+# Routing stays off (scores are still reported) while VLLM_API_URL is unset.
+VLLM_API_URL = os.environ.get("VLLM_API_URL", "")
+VLLM_MODEL = os.environ.get("VLLM_MODEL", "numind/NuMarkdown-8B-Thinking")
+VLLM_TEMPERATURE = float(os.environ.get("VLLM_TEMPERATURE", "0.4"))
+VLLM_MAX_TOKENS = int(os.environ.get("VLLM_MAX_TOKENS", "12000"))
+VLLM_MAX_PDF_PAGES = int(os.environ.get("VLLM_MAX_PDF_PAGES", "20"))
+VLLM_IMAGE_MAX_SIZE = int(os.environ.get("VLLM_IMAGE_MAX_SIZE", "2048"))
+OCR_ROUTER_THRESHOLD = float(os.environ.get("OCR_ROUTER_THRESHOLD", "0.75"))
+VLLM_CLIENT = None
+if VLLM_API_URL:
+    try:
+        from vllm_client import VllmClient
+        VLLM_CLIENT = VllmClient(VLLM_API_URL)
+    except ImportError as e:
+        print(f"Error loading the vLLM client, escalation is disabled: {e}")
+
+# Prometheus metrics on /metrics (OCR_METRICS=0 turns the endpoint off)
+OCR_METRICS = os.environ.get("OCR_METRICS", "1") != "0"
+METRICS = MetricsRegistry()
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "ocr_http_request_duration_seconds", "HTTP request latency.", ("method", "path", "status"))
+STAGE_SECONDS = METRICS.histogram(
+    "ocr_stage_duration_seconds", "Time spent in each extraction stage (summed over pages).", ("stage",))
+DOCUMENTS = METRICS.counter(
+    "ocr_documents_total", "Documents processed, by kind (pdf, image, other) and cache outcome.", ("kind", "cache"))
+PDF_PAGES = METRICS.counter(
+    "ocr_pdf_pages_total", "Extracted PDF pages, by path (text_layer or ocr).", ("path",))
+ESCALATIONS = METRICS.counter(
+    "ocr_escalations_total", "Extractions sent to NuMarkdown, by the result that was kept.", ("kept",))
+OCR_POOL_RESTARTS = METRICS.counter(
+    "ocr_pool_restarts_total", "OCR pools replaced after a worker died (OOM kill, crash in Tesseract).")
+METRICS.gauge("ocr_http_requests_in_flight", "HTTP requests being served.", func=lambda: _http_in_flight)
+METRICS.gauge("ocr_documents_in_flight", "Documents holding an OCR queue slot.", func=lambda: _ocr_in_flight)
+METRICS.gauge("ocr_extractions_in_flight", "Distinct extractions running (after coalescing).", func=lambda: len(OCR_IN_FLIGHT))
+METRICS.gauge("ocr_vllm_requests_in_flight", "Requests sent to vLLM and not yet answered.",
+              func=lambda: VLLM_CLIENT.in_flight if VLLM_CLIENT is not None else 0)
+METRICS.gauge("ocr_vllm_requests_waiting", "Requests waiting for a vLLM slot.",
+              func=lambda: VLLM_CLIENT.waiting if VLLM_CLIENT is not None else 0)
+
+
+def record_timing(timings, step: str, started: float):
+    """Add the milliseconds since ``started`` to ``timings[step]`` when timings are collected."""
+    if timings is not None:
+        timings[step] = timings.get(step, 0.0) + (time.perf_counter() - started) * 1000
+
+
+# upscale_to: long side small images are upscaled to; min_upscale: skip upscales below this factor.
+# autocontrast/sharpen: "always", "auto" (decided from image statistics) or "never".
+PREPROCESS_PROFILES = {
+    "fast": {"upscale_to": 1200, "min_upscale": 1.5, "resample": "BILINEAR", "autocontrast": "auto", "sharpen": "never"},
+    "balanced": {"upscale_to": 1800, "min_upscale": 1.25, "resample": "BICUBIC", "autocontrast": "auto", "sharpen": "auto"},
+    "accurate": {"upscale_to": 1800, "min_upscale": 1.0, "resample": "LANCZOS", "autocontrast": "always", "sharpen": "always"},
+}
+OCR_PREPROCESS_PROFILE = os.environ.get("OCR_PREPROCESS_PROFILE", "balanced")
+if OCR_PREPROCESS_PROFILE not in PREPROCESS_PROFILES:
+    OCR_PREPROCESS_PROFILE = "balanced"
+
+
+def needs_autocontrast(img: "Image.Image") -> bool:
+    """Autocontrast is a no-op when the histogram already spans (almost) the full range."""
+    low, high = img.getextrema()
+    return low > 10 or high < 245
+
+
+def needs_sharpen(img: "Image.Image") -> bool:
+    """
+    Estimate blur from a nearest-neighbour half-size sample: in crisp text most
+    edges are strong, in blurred text weak edges dominate.
+    """
+    sample = img.resize((max(1, img.size[0] // 2), max(1, img.size[1] // 2)), Image.Resampling.NEAREST)
+    hist = sample.filter(ImageFilter.FIND_EDGES).histogram()
+    edges = sum(hist[16:])
+    if not edges:
+        return False
+    return sum(hist[64:]) / edges < 0.5
 
 
-def preprocess_image(image: "Image.Image") -> "Image.Image":
+def preprocess_image(image: "Image.Image", profile: str = None, timings: dict = None) -> "Image.Image":
+    """
+    Prepare an image for Tesseract using one of PREPROCESS_PROFILES (default
+    OCR_PREPROCESS_PROFILE). ``timings`` collects per-step milliseconds.
+    """
     if not PIL_AVAILABLE:
         return image
 
-    img = image.convert("L")
-    img = ImageOps.autocontrast(img)
+    settings = PREPROCESS_PROFILES.get(profile or OCR_PREPROCESS_PROFILE, PREPROCESS_PROFILES["balanced"])
+
+    started = time.perf_counter()
+    img = image if image.mode == "L" else image.convert("L")
+    record_timing(timings, "preprocess_grayscale", started)
+
+    started = time.perf_counter()
+    if settings["autocontrast"] == "always" or (settings["autocontrast"] == "auto" and needs_autocontrast(img)):
+        img = ImageOps.autocontrast(img)
+    record_timing(timings, "preprocess_autocontrast", started)
+
     # Upscale small images to improve OCR accuracy
+    started = time.perf_counter()
     max_side = max(img.size)
-    if max_side < 1800:
-        scale = 1800 / max_side
+    scale = settings["upscale_to"] / max_side
+    if scale > 1 and scale >= settings["min_upscale"]:
         new_size = (int(img.size[0] * scale), int(img.size[1] * scale))
-        img = img.resize(new_size, Image.Resampling.LANCZOS)
-    img = img.filter(ImageFilter.SHARPEN)
+        img = img.resize(new_size, getattr(Image.Resampling, settings["resample"]))
+    record_timing(timings, "preprocess_upscale", started)
+
+    started = time.perf_counter()
+    if settings["sharpen"] == "always" or (settings["sharpen"] == "auto" and needs_sharpen(img)):
+        img = img.filter(ImageFilter.SHARPEN)
+    record_timing(timings, "preprocess_sharpen", started)
     return img
 
 
-def extract_items_from_image(image: "Image.Image", preprocessed: bool = False):
+class OcrResult:
+    """
+    Output of a single ``image_to_data`` run. ``data`` keeps the word boxes for
+    the item layout and ``text`` is rebuilt from the same words, so one
+    Tesseract pass serves both ``parse_invoice_text`` and ``extract_items_from_data``.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.text = self._build_text(data)
+        self.confidence, self.word_count = self._word_confidence(data)
+
+    @classmethod
+    def from_image(cls, image: "Image.Image", config: str = None):
+        global USE_TESSEROCR
+        config = config or TESSERACT_CONFIG
+        if USE_TESSEROCR:
+            try:
+                return cls(get_tesseract_engines().image_to_data(image, config))
+            except (RuntimeError, ImportError) as e:
+                # tesserocr raises RuntimeError when an engine cannot init (e.g. missing tessdata)
+                if not PYTESSERACT_AVAILABLE:
+                    raise
+                print(f"Error using in-process Tesseract, falling back to the tesseract binary: {e}")
+                USE_TESSEROCR = False
+        data = tesseract_binary().image_to_data(image, output_type=pytesseract.Output.DICT, config=config)
+        return cls(data)
+
+    @staticmethod
+    def _word_confidence(data):
+        """Mean Tesseract ``conf`` (0-100) over recognised words, and how many there were."""
+        confs = []
+        for word, conf in zip(data["text"], data.get("conf", [])):
+            conf = word_conf(conf)
+            if conf >= 0 and str(word).strip():
+                confs.append(conf)
+        return (sum(confs) / len(confs) if confs else 0.0), len(confs)
+
+    @staticmethod
+    def _build_text(data):
+        # Mirror image_to_string: words joined by spaces, one line per Tesseract
+        # line and a blank line between paragraphs/blocks.
+        out = []
+        current_line = None
+        current_par = None
+        words = []
+        for i in range(len(data["text"])):
+            word = data["text"][i].strip()
+            if not word:
+                continue
+            par = (data["block_num"][i], data["par_num"][i])
+            line = par + (data["line_num"][i],)
+            if line != current_line:
+                if words:
+                    out.append(" ".join(words) + "\n")
+                    words = []
+                if current_par is not None and par != current_par:
+                    out.append("\n")
+                current_line = line
+                current_par = par
+            words.append(word)
+        if words:
+            out.append(" ".join(words) + "\n")
+        return "".join(out)
+
+
+_tesseract_engines = None
+_tesseract_cmd_set = False
+
+
+def tesseract_binary():
+    """pytesseract, pointed at TESSERACT_CMD the first time this process uses it."""
+    global _tesseract_cmd_set
+    if not _tesseract_cmd_set:
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        _tesseract_cmd_set = True
+    return pytesseract
+
+
+def get_tesseract_engines() -> TesseractEnginePool:
+    """Engines of this process; every OCR pool worker builds and keeps its own."""
+    global _tesseract_engines
+    if _tesseract_engines is None:
+        _tesseract_engines = TesseractEnginePool.from_env()
+    return _tesseract_engines
+
+
+WARMUP_LINES = [
+    "TAX INVOICE",
+    "Invoice No.: 1001    Date: 01-04-2024",
+    "#  Item  Qty  Unit  Rate  GST  Amount",
+    "1  Steel bolt M8  10  nos  45.00  18%  450.00",
+    "Grand Total  Rs. 531.00",
+]
+_worker_warm_error = None
+
+
+def warm_ocr_worker():
+    """
+    Pool initializer: import the heavy modules and push one small synthetic page
+    through the text-layer item layout, rendering, preprocessing and OCR
+    (loading the main-pass engine) before the first document arrives.
+    """
+    global _worker_warm_error
+    if not OCR_WARMUP or not (PYMUPDF_AVAILABLE and PIL_AVAILABLE):
+        return
+    try:
+        with fitz.open() as doc:
+            page = doc.new_page(width=420, height=40 + 18 * len(WARMUP_LINES))
+            for i, line in enumerate(WARMUP_LINES):
+                page.insert_text((20, 30 + 18 * i), line, fontsize=10)
+            extract_items_from_data(pdf_words_to_data(page.get_text("words")))
+            with render_page_image(page, ocr_render_dpi(page)) as rendered:
+                img = preprocess_image(rendered)
+                if TESSERACT_AVAILABLE:
+                    extract_items_from_data(ocr_image(img).data)
+    except Exception as e:
+        # An initializer that raises breaks the whole pool; report it through /ready instead
+        _worker_warm_error = str(e)
+        print(f"Error warming OCR worker: {e}")
+
+
+def worker_warm_error():
+    return _worker_warm_error
+
+
+def word_conf(value) -> float:
+    """Tesseract reports ``conf`` as int, float or string; -1 marks non-word rows."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return -1.0
+
+
+def ocr_image(image: "Image.Image", timings=None) -> OcrResult:
+    started = time.perf_counter()
+    ocr = OcrResult.from_image(image)
+    record_timing(timings, "ocr", started)
+    return ocr
+
+
+def extract_items_from_image(image: "Image.Image", preprocessed: bool = False, ocr: OcrResult = None):
     if not (TESSERACT_AVAILABLE and PIL_AVAILABLE):
         return []
 
-    def normalize_token(text: str):
-        return re.sub(r'[^a-z]', '', text.lower())
+    if ocr is None:
+        img = image if preprocessed else preprocess_image(image)
+        ocr = ocr_image(img)
+    return extract_items_from_data(ocr.data)
+
+
+ROI_NUMBER_PATTERN = re.compile(r'\d')
+# Labels of the header fields; INVOICE_PARSER.classify_line knows the totals and taxes
+ROI_FIELD_LABEL_PATTERN = re.compile(r'\b(?:invoice|inv|date)\b', re.IGNORECASE)
+# Added to the band pass's block numbers so its lines never collide with the coarse pass's
+TABLE_BAND_BLOCK_OFFSET = 10_000
+
+
+def detect_table_band(data):
+    """
+    ``(top, bottom)`` pixels from the item header row (a line with "item" and
+    "amount", as extract_items_from_data looks for) down to the first total row
+    below it, or to the last line when there is none. None when no header is found.
+    """
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        word = str(word).strip()
+        if not word:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        entry = lines.setdefault(key, [data["top"][i], data["top"][i] + data["height"][i], []])
+        entry[0] = min(entry[0], data["top"][i])
+        entry[1] = max(entry[1], data["top"][i] + data["height"][i])
+        entry[2].append(word)
+
+    header_top = None
+    last_bottom = None
+    for top, bottom, words in sorted(lines.values(), key=lambda entry: entry[0]):
+        lower = " ".join(words).lower()
+        if header_top is None:
+            if "item" in lower and "amount" in lower:
+                header_top = top
+        elif "total" in INVOICE_PARSER.classify_line(lower):
+            return header_top, bottom
+        last_bottom = bottom
+    return (header_top, last_bottom) if header_top is not None else None
+
+
+def scale_word_boxes(data, factor: float):
+    scaled = dict(data)
+    for name in ("left", "top", "width", "height"):
+        scaled[name] = [round(value * factor) for value in data[name]]
+    return scaled
+
+
+def splice_band_words(data, band_data, top: int, bottom: int):
+    """
+    Replace the words of ``data`` whose vertical centre lies in ``[top, bottom]``
+    with the words of ``band_data`` (OCR of that band, boxes relative to ``top``),
+    keeping the band where its first replaced word was in reading order.
+    """
+    columns = list(data.keys())
+    band_rows = []
+    for j in range(len(band_data["text"])):
+        if not str(band_data["text"][j]).strip():
+            continue
+        row = {name: band_data[name][j] if name in band_data else data[name][0] for name in columns}
+        row["top"] = band_data["top"][j] + top
+        row["block_num"] = band_data["block_num"][j] + TABLE_BAND_BLOCK_OFFSET
+        band_rows.append(row)
+
+    spliced = {name: [] for name in columns}
+    inserted = False
+    for i in range(len(data["text"])):
+        centre = data["top"][i] + data["height"][i] / 2
+        if str(data["text"][i]).strip() and top <= centre <= bottom:
+            if not inserted:
+                for row in band_rows:
+                    for name in columns:
+                        spliced[name].append(row[name])
+                inserted = True
+            continue
+        for name in columns:
+            spliced[name].append(data[name][i])
+    if not inserted:
+        for row in band_rows:
+            for name in columns:
+                spliced[name].append(row[name])
+    return spliced
+
+
+def ocr_with_table_band(image: "Image.Image", timings=None) -> OcrResult:
+    """
+    Two-pass page OCR for the item path: a coarse pass over a reduced copy gives
+    the page text and the table band, then only the band is OCRed at full
+    resolution with OCR_TABLE_CONFIG and spliced in. Low-confidence field lines
+    outside the band are left to refine_low_confidence_fields.
+    """
+    started = time.perf_counter()
+    coarse = OcrResult.from_image(image.reduce(OCR_TABLE_COARSE_FACTOR) if OCR_TABLE_COARSE_FACTOR > 1 else image)
+    data = scale_word_boxes(coarse.data, OCR_TABLE_COARSE_FACTOR)
+    record_timing(timings, "ocr_coarse", started)
+
+    band = detect_table_band(data)
+    if band is None:
+        return OcrResult(data)
+    pad = 4 * OCR_TABLE_COARSE_FACTOR
+    top, bottom = max(0, band[0] - pad), min(image.height, band[1] + pad)
+    started = time.perf_counter()
+    band_ocr = OcrResult.from_image(image.crop((0, top, image.width, bottom)), config=OCR_TABLE_CONFIG)
+    record_timing(timings, "ocr_table_band", started)
+    return OcrResult(splice_band_words(data, band_ocr.data, top, bottom))
+
+
+def item_amount_column(data, lines):
+    """
+    ``(top, left)`` of the amount heading in the item table's header row (the
+    row extract_items_from_data keys on), or None when there is no such row.
+    """
+    for indices in sorted(lines.values(), key=lambda indices: min(data["top"][i] for i in indices)):
+        lower = " ".join(str(data["text"][i]) for i in indices).lower()
+        if "item" not in lower or "amount" not in lower:
+            continue
+        for i in indices:
+            if HEADER_COLUMN_TOKENS.get(LAYOUT_TOKEN_STRIP_PATTERN.sub('', str(data["text"][i]).lower())) == "amount":
+                return data["top"][i], data["left"][i]
+    return None
+
 
+def low_confidence_field_lines(data, min_conf: float = None, limit: int = None):
+    """
+    Find Tesseract lines that hold an invoice field and whose weakest word is
+    below ``min_conf``. Field lines carry a known label (invoice no., date,
+    total...) or a weak number in the item table's amount column; other item
+    cells are left alone, as a scan has too many of them to re-read. Returns ``(line_key, word_indices, box)`` tuples,
+    weakest first, with ``box`` as ``(left, top, right, bottom)`` pixels.
+    """
+    min_conf = OCR_FIELD_MIN_CONF if min_conf is None else min_conf
+    limit = OCR_ROI_MAX_REGIONS if limit is None else limit
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if str(word).strip() and word_conf(data["conf"][i]) >= 0:
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(i)
+
+    amount_column = item_amount_column(data, lines)
+    candidates = []
+    for key, indices in lines.items():
+        weak = [i for i in indices if word_conf(data["conf"][i]) < min_conf]
+        if not weak:
+            continue
+        text = " ".join(str(data["text"][i]) for i in indices)
+        # Words belong to the column their centre falls in, as in extract_items_from_data
+        weak_amount = amount_column is not None and any(
+            ROI_NUMBER_PATTERN.search(str(data["text"][i])) and data["top"][i] > amount_column[0]
+            and data["left"][i] + data["width"][i] / 2 >= amount_column[1]
+            for i in weak
+        )
+        labelled = ROI_FIELD_LABEL_PATTERN.search(text) or INVOICE_PARSER.classify_line(text.lower())
+        if not weak_amount and not labelled:
+            continue
+        box = (
+            min(data["left"][i] for i in indices),
+            min(data["top"][i] for i in indices),
+            max(data["left"][i] + data["width"][i] for i in indices),
+            max(data["top"][i] + data["height"][i] for i in indices),
+        )
+        weakest = min(word_conf(data["conf"][i]) for i in weak)
+        candidates.append((weakest, key, indices, box))
+    candidates.sort(key=lambda candidate: candidate[0])
+    return [(key, indices, box) for _, key, indices, box in candidates[:limit]]
+
+
+def splice_line_words(data, replacements):
+    """
+    Copy of ``data`` where each line in ``replacements`` (line key -> list of
+    ``(text, conf, left, top, width, height)``) has its words swapped for the new ones.
+    """
+    columns = list(data.keys())
+    spliced = {name: [] for name in columns}
+    done = set()
+    for i in range(len(data["text"])):
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key not in replacements or not str(data["text"][i]).strip():
+            for name in columns:
+                spliced[name].append(data[name][i])
+            continue
+        if key in done:
+            continue
+        done.add(key)
+        for word_num, (text, conf, left, top, width, height) in enumerate(replacements[key], start=1):
+            row = {name: data[name][i] for name in columns}
+            row.update(word_num=word_num, text=text, conf=conf, left=left, top=top, width=width, height=height)
+            for name in columns:
+                spliced[name].append(row[name])
+    return spliced
+
+
+def reread_replaces_line(old_words, new_words) -> bool:
+    """
+    Whether a re-read line may replace the original one, both given as
+    ``(text, conf)`` words. The re-read must keep at least as many words and as
+    many numbers, so its mean confidence is compared over comparable words:
+    Tesseract drops words it cannot read, and a shorter re-read can score higher
+    while losing the amount the pass exists to recover.
+    """
+    if not new_words or len(new_words) < len(old_words):
+        return False
+    def numbers(words):
+        return sum(1 for text, _ in words if ROI_NUMBER_PATTERN.search(str(text)))
+    if numbers(new_words) < numbers(old_words):
+        return False
+    def mean_confidence(words):
+        return sum(max(word_conf(conf), 0) for _, conf in words) / len(words)
+    return mean_confidence(new_words) > mean_confidence(old_words)
+
+
+def refine_low_confidence_fields(ocr: OcrResult, image: "Image.Image", render_region=None, timings=None) -> OcrResult:
+    """
+    Re-OCR only the lines holding low-confidence fields, at OCR_ROI_SCALE times
+    the resolution with OCR_ROI_CONFIG (single text line), and splice a reading
+    back into the word boxes when reread_replaces_line accepts it. ``render_region(box,
+    scale)`` can supply a sharper source (a PDF clip re-rendered at higher dpi);
+    by default the box is cropped from ``image`` and upscaled.
+    Returns a new OcrResult, or ``ocr`` itself when nothing improved.
+    """
+    if not OCR_ROI_REFINE:
+        return ocr
+    started = time.perf_counter()
+    data = ocr.data
+    replacements = {}
+    for key, indices, (left, top, right, bottom) in low_confidence_field_lines(data):
+        pad = max(2, (bottom - top) // 4)
+        box = (max(0, left - pad), max(0, top - pad), min(image.width, right + pad), min(image.height, bottom + pad))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            continue
+        if render_region is not None:
+            region = render_region(box, OCR_ROI_SCALE)
+        else:
+            size = (round((box[2] - box[0]) * OCR_ROI_SCALE), round((box[3] - box[1]) * OCR_ROI_SCALE))
+            region = image.crop(box).resize(size, Image.Resampling.LANCZOS)
+        new = OcrResult.from_image(region, config=OCR_ROI_CONFIG).data
+        kept = [j for j in range(len(new["text"])) if new["text"][j].strip() and word_conf(new["conf"][j]) >= 0]
+        old_words = [(data["text"][i], data["conf"][i]) for i in indices]
+        if not reread_replaces_line(old_words, [(new["text"][j].strip(), new["conf"][j]) for j in kept]):
+            continue
+        # Map the region's word boxes back onto the page image
+        scale_x = region.width / (box[2] - box[0])
+        scale_y = region.height / (box[3] - box[1])
+        replacements[key] = [
+            (
+                new["text"][j].strip(), new["conf"][j],
+                box[0] + round(new["left"][j] / scale_x), box[1] + round(new["top"][j] / scale_y),
+                round(new["width"][j] / scale_x), round(new["height"][j] / scale_y),
+            )
+            for j in kept
+        ]
+    record_timing(timings, "roi_refine", started)
+    if not replacements:
+        return ocr
+    return OcrResult(splice_line_words(data, replacements))
+
+
+def pdf_text_rows(words):
+    """
+    Group PyMuPDF words into visual rows, top to bottom and each row left to
+    right. PyMuPDF's own lines follow the PDF's text objects, and generators
+    that place every table cell as its own object give one "line" per cell; a
+    word here joins the row above when their vertical extents overlap by at
+    least half the shorter height, the way Tesseract would read the page.
+    """
+    rows = []  # [top, bottom, words]
+    for word in sorted(words, key=lambda word: (word[1], word[0])):
+        top, bottom = word[1], word[3]
+        if rows:
+            row = rows[-1]
+            overlap = min(row[1], bottom) - max(row[0], top)
+            if overlap >= 0.5 * min(row[1] - row[0], bottom - top):
+                row[0] = min(row[0], top)
+                row[1] = max(row[1], bottom)
+                row[2].append(word)
+                continue
+        rows.append([top, bottom, [word]])
+    return [sorted(row_words, key=lambda word: word[0]) for _, _, row_words in rows]
+
+
+def pdf_words_to_data(words):
+    """
+    Convert PyMuPDF ``page.get_text("words")`` tuples into the column layout of
+    ``pytesseract.image_to_data`` so digital pages share the OCR item layout.
+    Each visual row (see pdf_text_rows) becomes one line.
+    """
+    data = {key: [] for key in ("text", "block_num", "par_num", "line_num", "left", "top", "width", "height")}
+    for line_num, row in enumerate(pdf_text_rows(words)):
+        for x0, y0, x1, y1, text, *_ in row:
+            data["text"].append(text)
+            data["block_num"].append(0)
+            data["par_num"].append(0)
+            data["line_num"].append(line_num)
+            data["left"].append(x0)
+            data["top"].append(y0)
+            data["width"].append(x1 - x0)
+            data["height"].append(y1 - y0)
+    return data
+
+
+# Grouped thousands ("21,497.32") or a plain run of digits ("21497.32")
+LAYOUT_NUMBER_PATTERN = re.compile(r'[0-9]{1,3}(?:[, ][0-9]{3})+(?:\.\d{1,2})?|[0-9]+(?:\.\d{1,2})?')
+LAYOUT_QUANTITY_PATTERN = re.compile(r'[0-9]+(?:\.\d+)?')
+LAYOUT_TOKEN_STRIP_PATTERN = re.compile(r'[^a-z]')
+HEADER_COLUMN_TOKENS = {
+    "item": "item", "items": "item", "name": "item", "itemname": "item",
+    "qty": "quantity", "quantity": "quantity",
+    "unit": "unit",
+    "price": "price", "rate": "price",
+    "gst": "gst", "tax": "gst",
+    "amount": "amount", "amt": "amount",
+}
+
+
+class WordLayout:
+    """
+    Columnar view of ``image_to_data``-shaped word boxes. Words are grouped into
+    Tesseract lines ordered top to bottom, each line ordered left to right, using
+    one stable sort over all words instead of per-line Python sorts.
+    """
+
+    def __init__(self, data):
+        stripped = [text.strip() for text in data["text"]]
+        kept = [i for i, text in enumerate(stripped) if text]
+        self.texts = [stripped[i] for i in kept]
+        if NUMPY_AVAILABLE:
+            self._group_numpy(data, kept)
+        else:
+            self._group_python(data, kept)
+
+    def _group_numpy(self, data, kept):
+        idx = np.asarray(kept, dtype=np.intp)
+        if not len(idx):
+            self.left = []
+            self.center = np.empty(0)
+            self.lines = []
+            return
+        self.left = np.asarray(data["left"], dtype=np.float64)[idx]
+        self.center = self.left + np.asarray(data["width"], dtype=np.float64)[idx] / 2
+        top = np.asarray(data["top"], dtype=np.float64)[idx]
+        keys = np.stack([np.asarray(data[name])[idx] for name in ("block_num", "par_num", "line_num")], axis=1)
+        _, first_seen, line_of_word = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        line_of_word = line_of_word.reshape(-1)
+
+        line_top = np.full(len(first_seen), np.inf)
+        np.minimum.at(line_top, line_of_word, top)
+        # Lines by their highest word; ties keep first-appearance order
+        line_order = np.lexsort((first_seen, line_top))
+        line_rank = np.empty_like(line_order)
+        line_rank[line_order] = np.arange(len(line_order))
+
+        word_rank = line_rank[line_of_word]
+        order = np.lexsort((self.left, word_rank))
+        bounds = (np.flatnonzero(np.diff(word_rank[order])) + 1).tolist()
+        # Plain lists from here on: indexing Python lists with numpy scalars is slow
+        order = order.tolist()
+        self.left = self.left.tolist()
+        self.lines = [order[start:end] for start, end in zip([0] + bounds, bounds + [len(order)])]
+
+    def _group_python(self, data, kept):
+        self.left = [data["left"][i] for i in kept]
+        self.center = [data["left"][i] + data["width"][i] / 2 for i in kept]
+        line_ids = {}
+        line_of_word = []
+        line_top = []
+        for i in kept:
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            line_id = line_ids.setdefault(key, len(line_ids))
+            if line_id == len(line_top):
+                line_top.append(data["top"][i])
+            elif data["top"][i] < line_top[line_id]:
+                line_top[line_id] = data["top"][i]
+            line_of_word.append(line_id)
+        line_order = sorted(range(len(line_top)), key=line_top.__getitem__)
+        line_rank = [0] * len(line_order)
+        for rank, line_id in enumerate(line_order):
+            line_rank[line_id] = rank
+        order = sorted(range(len(kept)), key=lambda w: (line_rank[line_of_word[w]], self.left[w]))
+        self.lines = []
+        current_rank = None
+        for w in order:
+            rank = line_rank[line_of_word[w]]
+            if rank != current_rank:
+                self.lines.append([])
+                current_rank = rank
+            self.lines[-1].append(w)
+
+    def line_text(self, line):
+        texts = self.texts
+        return " ".join(texts[w] for w in line)
+
+    def assign_columns(self, col_positions):
+        """Column index for every word: the last column starting at or left of its center."""
+        if NUMPY_AVAILABLE:
+            cols = np.searchsorted(np.asarray(col_positions, dtype=np.float64), self.center, side="right") - 1
+            return np.maximum(cols, 0).tolist()
+        return [max(bisect.bisect_right(col_positions, x) - 1, 0) for x in self.center]
+
+
+def extract_items_from_data(data):
+    """Lay out line items from word boxes shaped like ``image_to_data`` output."""
     def parse_number(text: str):
-        match = re.findall(r'[0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?', text)
+        match = LAYOUT_NUMBER_PATTERN.findall(text)
         if not match:
             return None
         value = match[-1].replace(',', '').replace(' ', '')
@@ -93,7 +803,7 @@ def extract_items_from_image(image: "Image.Image", preprocessed: bool = False):
             return None
 
     def parse_quantity(text: str):
-        match = re.findall(r'[0-9]+(?:\.\d+)?', text)
+        match = LAYOUT_QUANTITY_PATTERN.findall(text)
         if not match:
             return None
         try:
@@ -101,50 +811,28 @@ def extract_items_from_image(image: "Image.Image", preprocessed: bool = False):
         except ValueError:
             return None
 
-    img = image if preprocessed else preprocess_image(image)
-    data = pytesseract.image_to_data(img, output_type=Output.DICT, config=TESSERACT_CONFIG)
-
-    lines_map = {}
-    for i in range(len(data["text"])):
-        text = data["text"][i].strip()
-        if not text:
-            continue
-        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
-        lines_map.setdefault(key, []).append({
-            "text": text,
-            "left": data["left"][i],
-            "top": data["top"][i],
-            "width": data["width"][i],
-            "height": data["height"][i],
-        })
-
-    lines = sorted(lines_map.values(), key=lambda words: min(w["top"] for w in words))
+    layout = WordLayout(data)
+    lines = layout.lines
     if not lines:
         return []
 
+    texts = layout.texts
+    left = layout.left
     header_index = None
     columns = {}
-    for idx, words in enumerate(lines):
-        line_text = " ".join(w["text"] for w in sorted(words, key=lambda w: w["left"]))
-        lower = line_text.lower()
+    for idx, line in enumerate(lines):
+        lower = layout.line_text(line).lower()
         if "item" in lower and "amount" in lower:
             header_index = idx
-            for word in words:
-                token = normalize_token(word["text"])
-                if token in {"item", "items", "name", "itemname"}:
-                    columns["item"] = min(columns.get("item", word["left"]), word["left"])
-                elif token in {"qty", "quantity"}:
-                    columns["quantity"] = word["left"]
-                elif token in {"unit"}:
-                    columns["unit"] = word["left"]
-                elif token in {"price", "rate"}:
-                    columns["price"] = word["left"]
-                elif token in {"gst", "tax"}:
-                    columns["gst"] = word["left"]
-                elif token in {"amount", "amt"}:
-                    columns["amount"] = word["left"]
+            # Header words in reading order, as Tesseract emitted them
+            for w in sorted(line):
+                column = HEADER_COLUMN_TOKENS.get(LAYOUT_TOKEN_STRIP_PATTERN.sub('', texts[w].lower()))
+                if column == "item":
+                    columns["item"] = min(columns.get("item", left[w]), left[w])
+                elif column:
+                    columns[column] = left[w]
             if "item" not in columns:
-                columns["item"] = min(w["left"] for w in words)
+                columns["item"] = min(left[w] for w in line)
             if "amount" in columns:
                 break
 
@@ -154,31 +842,21 @@ def extract_items_from_image(image: "Image.Image", preprocessed: bool = False):
     column_order = sorted(columns.items(), key=lambda entry: entry[1])
     col_names = [name for name, _ in column_order]
     col_positions = [pos for _, pos in column_order]
-
-    def assign_column(word):
-        x_center = word["left"] + word["width"] / 2
-        assigned = col_names[0]
-        for name, pos in column_order:
-            if x_center >= pos:
-                assigned = name
-            else:
-                break
-        return assigned
+    word_columns = layout.assign_columns(col_positions)
 
     items = []
-    for words in lines[header_index + 1:]:
-        line_text = " ".join(w["text"] for w in sorted(words, key=lambda w: w["left"]))
+    for line in lines[header_index + 1:]:
+        line_text = layout.line_text(line)
         if not line_text.strip():
             continue
         if "total" in line_text.lower():
             break
 
-        buckets = {name: [] for name in col_names}
-        for word in sorted(words, key=lambda w: w["left"]):
-            col = assign_column(word)
-            buckets[col].append(word["text"])
+        buckets = {}
+        for w in line:
+            buckets.setdefault(word_columns[w], []).append(texts[w])
 
-        row = {name: " ".join(tokens).strip() for name, tokens in buckets.items() if tokens}
+        row = {col_names[col]: " ".join(tokens).strip() for col, tokens in buckets.items()}
 
         item_text = row.get("item", "")
         tokens = item_text.split()
@@ -218,7 +896,216 @@ def extract_items_from_image(image: "Image.Image", preprocessed: bool = False):
 
     return items
 
-app = FastAPI()
+_ocr_pool = None
+_ocr_in_flight = 0
+_ocr_slot_waiters = deque()
+_http_in_flight = 0
+_warmup = {"done": False, "worker_errors": []}
+_warmup_task = None
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=warm_ocr_worker)
+    return _ocr_pool
+
+
+def ocr_pool_broken() -> bool:
+    """True when a worker of the current pool died; every call on it then fails."""
+    # ProcessPoolExecutor only exposes this through its private flag
+    return _ocr_pool is not None and bool(getattr(_ocr_pool, "_broken", False))
+
+
+def replace_broken_ocr_pool(broken: ProcessPoolExecutor):
+    """
+    Drop a pool that lost a worker and warm a fresh one in its place. Only the
+    first caller that saw ``broken`` fail replaces it; /ready reports 503 until
+    the new workers are warm.
+    """
+    global _ocr_pool
+    if _ocr_pool is not broken:
+        return
+    _ocr_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    OCR_POOL_RESTARTS.inc()
+    print("⚠️ An OCR worker died; replacing the OCR pool")
+    start_warm_up()
+
+
+def try_acquire_ocr_slot() -> bool:
+    """Reserve an in-flight slot; returns False when the queue is full."""
+    global _ocr_in_flight
+    if ocr_queue_full():
+        return False
+    _ocr_in_flight += 1
+    return True
+
+
+def ocr_queue_full() -> bool:
+    return _ocr_in_flight >= OCR_MAX_PENDING
+
+
+def release_ocr_slot():
+    """Free a slot, or hand it straight to the longest-waiting batch document."""
+    global _ocr_in_flight
+    while _ocr_slot_waiters:
+        waiter = _ocr_slot_waiters.popleft()
+        if not waiter.done():
+            waiter.set_result(None)
+            return
+    _ocr_in_flight = max(0, _ocr_in_flight - 1)
+
+
+async def acquire_ocr_slot():
+    """
+    Wait for an in-flight slot, first come first served; used by batches, which
+    queue instead of getting 429s. Waiters sleep until release_ocr_slot wakes
+    exactly one of them.
+    """
+    if try_acquire_ocr_slot():
+        return
+    waiter = asyncio.get_running_loop().create_future()
+    _ocr_slot_waiters.append(waiter)
+    try:
+        await waiter
+    except asyncio.CancelledError:
+        if waiter.cancelled():
+            try:
+                _ocr_slot_waiters.remove(waiter)
+            except ValueError:
+                pass  # already dropped by release_ocr_slot
+        else:
+            release_ocr_slot()  # the slot was handed over just as we were cancelled
+        raise
+
+
+class OcrQueueFull(Exception):
+    pass
+
+
+async def run_in_ocr_pool(func, *args):
+    """
+    Run ``func(*args)`` on the OCR pool. A worker that dies takes every call
+    pending on the pool down with BrokenProcessPool; those calls fail, and the
+    pool is replaced so later ones don't.
+    """
+    loop = asyncio.get_running_loop()
+    profile = ACTIVE_PROFILE.get()
+    pool = get_ocr_pool()
+    try:
+        if profile is None:
+            return await loop.run_in_executor(pool, func, *args)
+        result, stats = await loop.run_in_executor(pool, profiled_call, func, *args)
+    except BrokenProcessPool:
+        replace_broken_ocr_pool(pool)
+        raise
+    profile.add_stats(stats)
+    return result
+
+
+async def warm_up():
+    """
+    Start every OCR worker (each warms itself in warm_ocr_worker) and run the
+    parser once, so the first real uploads don't pay for imports, engine loads
+    and first-use regex compilation.
+    """
+    started = time.perf_counter()
+    if OCR_WARMUP:
+        # Workers start on demand, one per task submitted while none is idle
+        try:
+            errors = await asyncio.gather(*(run_in_ocr_pool(worker_warm_error) for _ in range(OCR_WORKERS)))
+        except BrokenProcessPool:
+            return  # the replacement pool runs a warm-up of its own
+        _warmup["worker_errors"] = sorted({error for error in errors if error})
+        parse_invoice_text("\n".join(WARMUP_LINES), "warmup.pdf")
+        print(f"🔥 Warmed {OCR_WORKERS} OCR workers and the parser in {time.perf_counter() - started:.1f}s")
+    _warmup["done"] = True
+
+
+def start_warm_up():
+    global _warmup_task
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    _warmup["done"] = False
+    _warmup_task = asyncio.ensure_future(warm_up())
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    start_warm_up()
+    yield
+    _warmup_task.cancel()
+    global _ocr_pool
+    if VLLM_CLIENT is not None:
+        await VLLM_CLIENT.close()
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware that bounds request bodies on the upload routes while they
+    arrive, before FastAPI parses them into spool files of its own. A
+    Content-Length over the limit is refused without reading the body, and a
+    body that streams past it is cut off; both get a 413.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits  # path -> (bytes, message)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        max_bytes, message = limit
+        too_large = JSONResponse(error_payload("uploaded_file", message, "File too large"), status_code=413)
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > max_bytes:
+            await too_large(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app answers after the cut-off is replaced by the 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # FastAPI reports the cut-off as a body parsing error, or it surfaces as is
+            if not exceeded:
+                raise
+        if exceeded:
+            await too_large(scope, receive, send)
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Bodies are bounded before parsing; the multipart slack covers part headers and boundaries
+MULTIPART_SLACK_BYTES = 1024 * 1024
+app.add_middleware(UploadSizeLimit, limits={
+    "/upload": (OCR_MAX_UPLOAD_BYTES + MULTIPART_SLACK_BYTES,
+                f"File exceeds the {OCR_MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit."),
+    "/upload/batch": (OCR_BATCH_MAX_BYTES + MULTIPART_SLACK_BYTES,
+                      f"Batch exceeds the {OCR_BATCH_MAX_BYTES // (1024 * 1024)} MB upload limit."),
+})
 
 # Add CORS middleware
 app.add_middleware(
@@ -542,72 +1429,897 @@ HTML_CONTENT = """
 </html>
 """
 
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Request latency histogram, in-flight gauge and a ``total`` Server-Timing entry on every response."""
+    global _http_in_flight
+    started = time.perf_counter()
+    _http_in_flight += 1
+    try:
+        response = await call_next(request)
+    finally:
+        _http_in_flight -= 1
+    elapsed = time.perf_counter() - started
+    # Route templates keep label cardinality bounded; streamed responses are timed to their headers
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, path=route.path if route else "unmatched",
+                                 status=response.status_code)
+    response.headers.append("Server-Timing", f"total;dur={elapsed * 1000:.1f}")
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     return HTML_CONTENT
 
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop is serving requests."""
+    return JSONResponse({"status": "ok"})
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: OCR workers started and warmed, the OCR pool intact, Tesseract
+    found and, when escalation is configured, vLLM reachable. 503 until all of
+    them hold.
+    """
+    pool_ok = not ocr_pool_broken()
+    if not pool_ok:
+        # A worker died between requests; start replacing the pool now
+        replace_broken_ocr_pool(_ocr_pool)
+    checks = {
+        "warmed": _warmup["done"] and not _warmup["worker_errors"],
+        "ocr_pool": pool_ok,
+        "tesseract": TESSERACT_AVAILABLE,
+    }
+    if VLLM_CLIENT is not None:
+        checks["vllm"] = await VLLM_CLIENT.ping()
+    is_ready = all(checks.values())
+    body = {"status": "ready" if is_ready else "not ready", "checks": checks}
+    if _warmup["worker_errors"]:
+        body["errors"] = _warmup["worker_errors"]
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    if not OCR_METRICS:
+        return JSONResponse({"status": "error", "message": "Metrics are disabled (OCR_METRICS=0)."}, status_code=404)
+    return Response(METRICS.render(), media_type=MetricsRegistry.CONTENT_TYPE)
+
+def page_has_text_layer(text: str) -> bool:
+    """True when an embedded text layer has text and is not mostly garbage."""
+    visible = "".join(text.split())
+    if not visible:
+        return False
+    # Broken font encodings come out as replacement characters and symbol soup
+    readable = sum(1 for ch in visible if ch.isalnum())
+    return readable / len(visible) >= 0.5
+
+
+def page_needs_ocr(page, layer_text: str) -> bool:
+    """
+    Whether a PDF page is rasterized and OCRed: its text layer is empty or
+    unreadable, or it is shorter than PDF_TEXT_MIN_CHARS on a page that also
+    carries images. A digital page with little text on it is read as it is.
+    """
+    if not page_has_text_layer(layer_text):
+        return True
+    return len("".join(layer_text.split())) < PDF_TEXT_MIN_CHARS and bool(page.get_images())
+
+
+def read_pdf_text_layers(path: str):
+    """
+    Open the PDF once and read every page's text layer. Pages with a usable layer
+    are final (page 0 also takes its items from the layer's word boxes); the rest
+    are flagged for OCR. Returns one ``{"text", "items", "needs_ocr"}`` per page.
+    """
+    can_ocr = PIL_AVAILABLE and TESSERACT_AVAILABLE
+    pages = []
+    pdf_document = fitz.open(path)
+    try:
+        for page_num, page in enumerate(pdf_document):
+            layer_text = page.get_text()
+            needs_ocr = can_ocr and page_needs_ocr(page, layer_text)
+            items = []
+            if page_num == 0 and not needs_ocr:
+                items = extract_items_from_data(pdf_words_to_data(page.get_text("words")))
+            pages.append({"text": layer_text, "items": items, "needs_ocr": needs_ocr})
+    finally:
+        pdf_document.close()
+    return pages
+
+
+def ocr_render_dpi(page) -> float:
+    """
+    Render at PDF_OCR_DPI, raised just enough that the long side reaches the
+    preprocessing target, so small pages are never rendered and then upscaled.
+    """
+    settings = PREPROCESS_PROFILES.get(OCR_PREPROCESS_PROFILE, PREPROCESS_PROFILES["balanced"])
+    long_side_pt = max(page.rect.width, page.rect.height) or 1
+    return max(PDF_OCR_DPI, settings["upscale_to"] * 72 / long_side_pt)
+
+
+@contextmanager
+def render_page_image(page, dpi: float, grayscale: bool = True, clip=None):
+    """
+    Render a PDF page directly in the colorspace OCR needs and yield a PIL image
+    wrapping the pixmap's sample buffer without copying (no PNG encode/decode).
+    The image is only valid inside the block: it is closed before the pixmap
+    that owns its pixels goes away.
+    """
+    # A zoom matrix rather than dpi=, which only accepts whole numbers
+    zoom = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False)
+    mode = "L" if grayscale else "RGB"
+    image = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+    try:
+        yield image
+    finally:
+        image.close()
+        del pix
+
+
+def pdf_region_renderer(page, image):
+    """
+    ``render_region`` for refine_low_confidence_fields that re-renders a box of
+    ``image`` (pixels of the page render) straight from the PDF at a higher dpi.
+    """
+    if page.rotation:
+        return None  # clip rectangles are unrotated; cropping the image is good enough
+    points_per_pixel = page.rect.width / image.width
+
+    def render_region(box, scale):
+        clip = fitz.Rect(*(value * points_per_pixel for value in box)) + (page.rect.x0, page.rect.y0, page.rect.x0, page.rect.y0)
+        with render_page_image(page, 72 / points_per_pixel * scale, clip=clip) as region:
+            return ImageOps.autocontrast(region)
+
+    return render_region
+
+
+def ocr_pdf_page(path: str, page_num: int, with_items: bool):
+    """Rasterize and OCR a single PDF page in a pool worker; returns ``{"text", "items", "timings"}``."""
+    timings = {}
+    pdf_document = fitz.open(path)
+    try:
+        page = pdf_document[page_num]
+        started = time.perf_counter()
+        with render_page_image(page, ocr_render_dpi(page)) as rendered:
+            record_timing(timings, "render", started)
+            img = preprocess_image(rendered, timings=timings)
+            ocr = ocr_with_table_band(img, timings) if OCR_TABLE_BAND and with_items else ocr_image(img, timings)
+            ocr = refine_low_confidence_fields(ocr, img, pdf_region_renderer(page, img), timings)
+            started = time.perf_counter()
+            items = extract_items_from_image(img, ocr=ocr) if with_items else []
+            record_timing(timings, "items", started)
+        return {"text": ocr.text, "items": items, "timings": timings,
+                "confidence": ocr.confidence, "words": ocr.word_count}
+    finally:
+        pdf_document.close()
+
+
+async def extract_pdf(path: str):
+    """
+    Read text layers in one pass, then fan the pages that need OCR out across the
+    pool (at most OCR_MAX_PAGES_PER_DOC at a time) and stitch the text back in
+    page order; a readable layer on an OCRed page is kept ahead of the OCR text.
+    Returns ``{"text", "items", "timings"}`` with timings summed over pages, plus
+    ``failed_pages`` (1-based) when some pages could not be OCRed and kept only
+    their text layer.
+    """
+    timings = {}
+    started = time.perf_counter()
+    pages = await run_in_ocr_pool(read_pdf_text_layers, path)
+    record_timing(timings, "text_layer", started)
+    ocr_pages = sum(1 for page in pages if page["needs_ocr"])
+    PDF_PAGES.inc(len(pages) - ocr_pages, path="text_layer")
+    PDF_PAGES.inc(ocr_pages, path="ocr")
+    page_limit = asyncio.Semaphore(OCR_MAX_PAGES_PER_DOC)
+    failed_pages = []
+
+    async def ocr_page(page_num):
+        async with page_limit:
+            try:
+                ocred = await run_in_ocr_pool(ocr_pdf_page, path, page_num, page_num == 0)
+            except Exception as e:
+                print(f"Error OCRing PDF page {page_num + 1}: {e}")
+                failed_pages.append(page_num + 1)
+                return
+        layer_text = pages[page_num]["text"]
+        if page_has_text_layer(layer_text):
+            # The layer's words are exact; OCR only adds what the images around them hold
+            ocred["text"] = layer_text + ocred["text"]
+        pages[page_num] = ocred
+
+    await asyncio.gather(*(ocr_page(page_num) for page_num, page in enumerate(pages) if page["needs_ocr"]))
+    text = "".join(page["text"] for page in pages)
+    items = pages[0]["items"] if pages else []
+    for page in pages:
+        for step, elapsed in page.get("timings", {}).items():
+            timings[step] = timings.get(step, 0.0) + elapsed
+    extraction = {"text": text, "items": items, "timings": timings, "ocr_confidence": combined_ocr_confidence(pages)}
+    if failed_pages:
+        extraction["failed_pages"] = sorted(failed_pages)
+    return extraction
+
+
+def combined_ocr_confidence(pages):
+    """
+    Word-weighted mean confidence over OCRed pages, or None when every page
+    came from its text layer (nothing was guessed by Tesseract).
+    """
+    ocr_pages = [page for page in pages if "confidence" in page]
+    if not ocr_pages:
+        return None
+    # Text-layer words are exact, so they count as fully confident
+    total_words = sum(page["words"] for page in ocr_pages)
+    total_conf = sum(page["confidence"] * page["words"] for page in ocr_pages)
+    for page in pages:
+        if "confidence" not in page:
+            layer_words = len(page["text"].split())
+            total_words += layer_words
+            total_conf += 100.0 * layer_words
+    return total_conf / total_words if total_words else 0.0
+
+
+def error_payload(filename: str, message: str, notes: str):
+    return {
+        "status": "error",
+        "message": message,
+        "filename": filename,
+        "extracted_data": {
+            "invoice_number": "",
+            "date": "",
+            "due_date": "",
+            "vendor": "",
+            "total": "0",
+            "description": "Error extracting data",
+            "notes": notes
+        }
+    }
+
+
+def detect_document_kind(filename: str, content_type: str):
+    """Return ``(is_pdf, is_image)`` from the upload's filename and content type."""
+    lower_name = filename.lower()
+    is_pdf = lower_name.endswith('.pdf')
+    if content_type:
+        is_image = content_type.startswith('image/')
+    else:
+        is_image = lower_name.endswith(('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff'))
+    return is_pdf, is_image
+
+
+def extraction_cache_key(content_hash: str, is_pdf: bool, is_image: bool) -> str:
+    return EXTRACTION_CACHE.make_key(
+        content_hash,
+        kind="pdf" if is_pdf else "image" if is_image else "other",
+        parser_version=PARSER_VERSION,
+        tesseract_config=TESSERACT_CONFIG,
+        preprocess_profile=OCR_PREPROCESS_PROFILE,
+        router_threshold=OCR_ROUTER_THRESHOLD if VLLM_CLIENT else None,
+        roi_refine=[OCR_FIELD_MIN_CONF, OCR_ROI_SCALE, OCR_ROI_MAX_REGIONS, OCR_ROI_CONFIG] if OCR_ROI_REFINE else None,
+        table_band=[OCR_TABLE_COARSE_FACTOR, OCR_TABLE_CONFIG] if OCR_TABLE_BAND else None,
+    )
+
+
+def require_admin(token: str):
+    if not OCR_ADMIN_TOKEN:
+        return JSONResponse({"status": "error", "message": "Admin endpoints are disabled (set OCR_ADMIN_TOKEN)."}, status_code=403)
+    if token != OCR_ADMIN_TOKEN:
+        return JSONResponse({"status": "error", "message": "Invalid admin token."}, status_code=401)
+    return None
+
+
+@app.get("/cache/stats")
+async def cache_stats(x_admin_token: str = Header(None)):
+    denied = require_admin(x_admin_token)
+    if denied:
+        return denied
+    stats = await asyncio.to_thread(EXTRACTION_CACHE.stats)
+    stats["in_flight"] = len(OCR_IN_FLIGHT)
+    stats["coalesced"] = OCR_IN_FLIGHT.coalesced
+    return JSONResponse(stats)
+
+
+@app.delete("/cache")
+async def cache_invalidate(sha256: str = None, x_admin_token: str = Header(None)):
+    """Invalidate cached extractions for one document (by content sha256) or everything."""
+    denied = require_admin(x_admin_token)
+    if denied:
+        return denied
+    removed = await asyncio.to_thread(EXTRACTION_CACHE.invalidate, sha256)
+    return JSONResponse({"status": "success", "removed": removed})
+
+
+@app.get("/profiles")
+async def list_profiles(x_admin_token: str = Header(None)):
+    """Request profiles in the ring, newest first, with their input hashes."""
+    denied = require_admin(x_admin_token)
+    if denied:
+        return denied
+    return JSONResponse({"profiles": await asyncio.to_thread(PROFILE_RING.list)})
+
+
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, part: str = "profile", x_admin_token: str = Header(None)):
+    """Download a profile (pstats format) or, with ``part=input``, the document it was taken on."""
+    denied = require_admin(x_admin_token)
+    if denied:
+        return denied
+    path = PROFILE_RING.path(profile_id, ".input" if part == "input" else ".prof")
+    if path is None:
+        return JSONResponse({"status": "error", "message": "Profile not found."}, status_code=404)
+    return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def new_spool_file():
+    return tempfile.NamedTemporaryFile(prefix="ocr-upload-", dir=OCR_SPOOL_DIR, delete=False)
+
+
+async def spool_upload(upload: UploadFile):
+    """
+    Copy an upload to a spool file in OCR_SPOOL_CHUNK_BYTES chunks, hashing as it
+    goes, so request memory stays flat regardless of file size. Returns
+    ``(path, sha256)``; raises UploadTooLarge past OCR_MAX_UPLOAD_BYTES.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    spool = new_spool_file()
+    try:
+        with spool:
+            while True:
+                chunk = await upload.read(OCR_SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > OCR_MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        discard_spool_file(spool.name)
+        raise
+    return spool.name, digest.hexdigest()
+
+
+def link_spool_file(path: str) -> str:
+    """
+    A second name for a spool file, removed independently of the first: a hard
+    link, or a copy where the filesystem has none.
+    """
+    link = f"{path}-{os.urandom(4).hex()}"
+    try:
+        os.link(path, link)
+    except OSError:
+        shutil.copyfile(path, link)
+    return link
+
+
+def discard_spool_file(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def hash_upload(fileobj) -> str:
+    """
+    sha256 of an upload FastAPI already spooled, read in place rather than
+    copied; raises UploadTooLarge past OCR_MAX_UPLOAD_BYTES. Blocking.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(OCR_SPOOL_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > OCR_MAX_UPLOAD_BYTES:
+            raise UploadTooLarge()
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def spool_file_object(fileobj) -> str:
+    """Copy an open upload to a new spool file (pool workers need a path); returns the path. Blocking."""
+    spool = new_spool_file()
+    try:
+        with spool:
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, spool, OCR_SPOOL_CHUNK_BYTES)
+    except BaseException:
+        discard_spool_file(spool.name)
+        raise
+    return spool.name
+
+
+async def process_document(source, content_hash: str, filename: str, content_type: str, wait_for_slot: bool = False):
+    """
+    Extract one document through the cache and the OCR pool. ``source`` is a
+    spool file path, or an UploadFile that is copied to a spool file only when
+    it misses the cache and is admitted to the OCR queue.
+    Returns ``(payload, cache_status, timings)`` with status hit, miss or
+    coalesced and per-stage milliseconds; raises OcrQueueFull when the queue is
+    full and ``wait_for_slot`` is False.
+    """
+    is_pdf, is_image = detect_document_kind(filename, content_type)
+    cache_key = extraction_cache_key(content_hash, is_pdf, is_image)
+    started = time.perf_counter()
+    # The disk tier reads files, and writes may rescan the cache directory: keep both off the event loop
+    extraction = await asyncio.to_thread(EXTRACTION_CACHE.get, cache_key)
+    request_timings = {}
+    record_timing(request_timings, "cache_lookup", started)
+    if extraction is not None:
+        return finish_document(extraction, filename, is_pdf, is_image, "hit", request_timings)
+
+    # Batch documents wait for a slot and /upload ones get 429s, so each only joins its own kind
+    flight_key = f"{cache_key}:{'wait' if wait_for_slot else 'fast'}"
+    copied = None
+    # Followers never copy; with no copy there is no await between this check and the join below
+    if not isinstance(source, str) and flight_key not in OCR_IN_FLIGHT:
+        # Refuse before copying; the slot itself is taken when the extraction starts
+        if not wait_for_slot and ocr_queue_full():
+            raise OcrQueueFull()
+        started = time.perf_counter()
+        copied = await asyncio.to_thread(spool_file_object, source.file)
+        record_timing(request_timings, "spool", started)
+        STAGE_SECONDS.observe(request_timings["spool"] / 1000, stage="spool")
+
+    async def extract(path):
+        if wait_for_slot:
+            await acquire_ocr_slot()
+        elif not try_acquire_ocr_slot():
+            raise OcrQueueFull()
+        try:
+            extraction = await extract_content(path, is_pdf, is_image)
+        finally:
+            release_ocr_slot()
+        extraction = await route_extraction(extraction, path, is_pdf, is_image, filename)
+        timings = extraction.pop("timings", {})
+        # Empty or partial results may come from transient failures, so only complete text is cached
+        if extraction["text"].strip() and not extraction.get("failed_pages"):
+            await asyncio.to_thread(EXTRACTION_CACHE.put, cache_key, extraction)
+        # Observed once per extraction, not once per coalesced request
+        for step, elapsed in timings.items():
+            STAGE_SECONDS.observe(elapsed / 1000, stage=step)
+        return extraction, timings
+
+    def start():
+        nonlocal copied
+        # The extraction owns a file of its own, valid however long the request that started it lives
+        owned = copied or link_spool_file(source)
+        copied = None
+        task = asyncio.ensure_future(extract(owned))
+        task.add_done_callback(lambda _: discard_spool_file(owned))
+        return task
+
+    # Double clicks and client retries attach to the extraction already running
+    try:
+        with OCR_IN_FLIGHT.join(flight_key, start) as (task, shared):
+            extraction, timings = await asyncio.shield(task)
+    finally:
+        if copied:
+            discard_spool_file(copied)  # another request's extraction started while this one copied
+    return finish_document(extraction, filename, is_pdf, is_image, "coalesced" if shared else "miss", {**request_timings, **timings})
+
+
+def finish_document(extraction, filename: str, is_pdf: bool, is_image: bool, cache_status: str, timings: dict):
+    """Count the document, build its payload and time the parse; returns process_document's triple."""
+    DOCUMENTS.inc(kind="pdf" if is_pdf else "image" if is_image else "other", cache=cache_status)
+    STAGE_SECONDS.observe(timings["cache_lookup"] / 1000, stage="cache_lookup")
+    payload = build_payload(extraction, filename, is_pdf, timings)
+    STAGE_SECONDS.observe(timings.get("parse", 0.0) / 1000, stage="parse")
+    return payload, cache_status, timings
+
+
+def save_request_profile(profile, elapsed_ms: float, content_hash: str, source, **details):
+    """Store a finished request profile in PROFILE_RING unless it only ran to catch slow requests and was fast."""
+    if profile.trigger == "slow" and elapsed_ms < OCR_PROFILE_SLOW_MS:
+        return None
+    try:
+        return PROFILE_RING.save(profile, content_hash, source, elapsed_ms=round(elapsed_ms, 1), **details)
+    except OSError as e:
+        print(f"Error saving request profile: {e}")
+        return None
+
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), x_profile: str = Header(None), x_admin_token: str = Header(None)):
     """
     Extract invoice data from uploaded file.
     Uses basic text extraction when vLLM backend is not configured.
     """
+    filename = file.filename or "uploaded_file"
+    requested = x_profile == "1" and bool(OCR_ADMIN_TOKEN) and x_admin_token == OCR_ADMIN_TOKEN
+    trigger = choose_trigger(requested, OCR_PROFILE_SAMPLE_RATE, OCR_PROFILE_SLOW_MS)
+    profile = RequestProfile(trigger) if trigger else None
+    profile_token = ACTIVE_PROFILE.set(profile)
     try:
-        # Read file content
-        content = await file.read()
-        extracted_text = ""
-        filename = file.filename or "uploaded_file"
-        lower_name = filename.lower()
-        is_pdf = lower_name.endswith('.pdf')
-        if file.content_type:
-            is_image = file.content_type.startswith('image/')
-        else:
-            is_image = lower_name.endswith(('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff'))
-        items_from_image = []
+        timings = {}
+        started = time.perf_counter()
+        # FastAPI has already spooled the body; hash it where it is and copy only on a cache miss
+        content_hash = await asyncio.to_thread(hash_upload, file.file)
+        record_timing(timings, "hash", started)
+        STAGE_SECONDS.observe(timings["hash"] / 1000, stage="hash")
+        payload, cache_status, document_timings = await process_document(file, content_hash, filename, file.content_type)
+        timings.update(document_timings)
+        headers = {"X-Cache": cache_status, "Server-Timing": server_timing_header(timings, cache=cache_status)}
+        if profile is not None:
+            profile_id = await asyncio.to_thread(
+                save_request_profile, profile, (time.perf_counter() - started) * 1000, content_hash, file.file,
+                filename=filename, content_type=file.content_type, cache=cache_status, timings=timings)
+            if profile_id:
+                headers["X-Profile-Id"] = profile_id
+        return JSONResponse(payload, headers=headers)
+    except UploadTooLarge:
+        payload = error_payload(filename, f"File exceeds the {OCR_MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit.", "File too large")
+        return JSONResponse(payload, status_code=413)
+    except OcrQueueFull:
+        payload = error_payload(filename, "OCR queue is full, please retry shortly.", "Server is busy")
+        return JSONResponse(payload, status_code=429, headers={"Retry-After": str(OCR_RETRY_AFTER)})
+    except Exception as e:
+        return JSONResponse(error_payload(filename, f"Error processing file: {str(e)}", f"Could not process file: {str(e)}"))
+    finally:
+        ACTIVE_PROFILE.reset(profile_token)
 
-        # Extract text from PDF if PyMuPDF is available
-        if is_pdf and PYMUPDF_AVAILABLE:
-            try:
-                pdf_document = fitz.open(stream=content, filetype="pdf")
-                for page_num in range(len(pdf_document)):
-                    page = pdf_document[page_num]
-                    extracted_text += page.get_text()
-                pdf_document.close()
-            except Exception as e:
-                print(f"Error extracting PDF text: {e}")
 
-        # OCR fallback for PDFs with no embedded text
-        if is_pdf and PYMUPDF_AVAILABLE and PIL_AVAILABLE and TESSERACT_AVAILABLE:
-            try:
-                pdf_document = fitz.open(stream=content, filetype="pdf")
-                ocr_text_needed = not extracted_text.strip() or len(extracted_text.strip()) < 50
-                for page_num in range(len(pdf_document)):
-                    page = pdf_document[page_num]
-                    pix = page.get_pixmap(dpi=300)
-                    img = Image.open(io.BytesIO(pix.tobytes("png")))
-                    img = preprocess_image(img)
-                    if ocr_text_needed:
-                        extracted_text += pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
-                    if page_num == 0 and not items_from_image:
-                        items_from_image = extract_items_from_image(img, preprocessed=True)
-                pdf_document.close()
-            except Exception as e:
-                print(f"Error OCRing PDF: {e}")
+def is_zip_upload(filename: str, content_type: str) -> bool:
+    return filename.lower().endswith(".zip") or content_type in {"application/zip", "application/x-zip-compressed"}
+
+
+def zip_member_error(member, budget: int):
+    """
+    Why ``member`` must not be decompressed, judged from its header before any
+    byte is inflated, or None. zipfile never inflates past the declared size.
+    """
+    if member.file_size > OCR_MAX_UPLOAD_BYTES:
+        return "File exceeds the upload limit"
+    if member.file_size > budget:
+        return "Batch exceeds its decompressed size limit"
+    if member.file_size > OCR_SPOOL_CHUNK_BYTES and member.file_size > OCR_ZIP_MAX_RATIO * max(member.compress_size, 1):
+        return "Suspicious compression ratio"
+    return None
+
+
+def expand_zip_upload(path: str, budget: int):
+    """
+    Spool every file inside a ZIP to its own spool file, enforcing
+    OCR_MAX_UPLOAD_BYTES on the bytes actually decompressed and spooling at most
+    ``budget`` bytes in all. Returns ``(documents, bytes spooled)`` with
+    documents as ``(filename, path, sha256, error)``.
+    """
+    documents = []
+    spooled = 0
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            base = os.path.basename(name)
+            if member.is_dir() or not base or base.startswith(".") or name.startswith("__MACOSX/"):
+                continue
+            if len(documents) >= OCR_BATCH_MAX_FILES:
+                break
+            error = zip_member_error(member, budget - spooled)
+            if error:
+                documents.append((name, None, None, error))
+                continue
+            digest = hashlib.sha256()
+            size = 0
+            spool = new_spool_file()
+            with spool, archive.open(member) as source:
+                while True:
+                    chunk = source.read(OCR_SPOOL_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > OCR_MAX_UPLOAD_BYTES:
+                        break
+                    digest.update(chunk)
+                    spool.write(chunk)
+            if size > OCR_MAX_UPLOAD_BYTES:
+                discard_spool_file(spool.name)
+                documents.append((name, None, None, "File exceeds the upload limit"))
+            else:
+                spooled += size
+                documents.append((name, spool.name, digest.hexdigest(), None))
+    return documents, spooled
 
-        # OCR for images
-        if is_image and PIL_AVAILABLE and TESSERACT_AVAILABLE:
+
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """
+    Extract many invoices in one request. Accepts several files and/or ZIP archives
+    and streams one NDJSON line per document as it finishes (same payload as
+    /upload plus its position), followed by a summary line.
+    """
+    # (filename, content_type, spool path, sha256, error)
+    documents = []
+    batch_bytes = 0
+    try:
+        for upload in files:
+            if len(documents) >= OCR_BATCH_MAX_FILES:
+                break
+            upload_name = upload.filename or "uploaded_file"
             try:
-                img = Image.open(io.BytesIO(content))
-                img = preprocess_image(img)
-                extracted_text = pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
-                items_from_image = extract_items_from_image(img, preprocessed=True)
-            except Exception as e:
-                print(f"Error OCRing image: {e}")
+                path, content_hash = await spool_upload(upload)
+            except UploadTooLarge:
+                documents.append((upload_name, None, None, None, "File exceeds the upload limit"))
+                continue
+            if not is_zip_upload(upload_name, upload.content_type):
+                size = os.path.getsize(path)
+                if batch_bytes + size > OCR_BATCH_MAX_BYTES:
+                    discard_spool_file(path)
+                    documents.append((upload_name, None, None, None, "Batch exceeds its decompressed size limit"))
+                    continue
+                batch_bytes += size
+                documents.append((upload_name, upload.content_type, path, content_hash, None))
+                continue
+            try:
+                members, spooled = await asyncio.to_thread(expand_zip_upload, path, max(0, OCR_BATCH_MAX_BYTES - batch_bytes))
+                batch_bytes += spooled
+                documents.extend((name, None, member_path, member_hash, error) for name, member_path, member_hash, error in members)
+            except zipfile.BadZipFile:
+                documents.append((upload_name, None, None, None, "not a valid ZIP archive"))
+            finally:
+                discard_spool_file(path)
+    except BaseException:
+        for document in documents:
+            if document[2]:
+                discard_spool_file(document[2])
+        raise
+    for document in documents[OCR_BATCH_MAX_FILES:]:
+        if document[2]:
+            discard_spool_file(document[2])
+    documents = documents[:OCR_BATCH_MAX_FILES]
+
+    async def run_one(index, name, content_type, path, content_hash, error):
+        started = time.perf_counter()
+        try:
+            if error:
+                payload = error_payload(name, f"Error processing file: {error}", "Could not process file")
+            else:
+                payload, _, _ = await process_document(path, content_hash, name, content_type, wait_for_slot=True)
+        except Exception as e:
+            payload = error_payload(name, f"Error processing file: {str(e)}", f"Could not process file: {str(e)}")
+        finally:
+            if path:
+                discard_spool_file(path)
+        payload["index"] = index
+        payload["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return payload
+
+    async def stream_results():
+        started = time.perf_counter()
+        counts = {"success": 0, "partial": 0, "error": 0}
+        failures = []
+        tasks = [asyncio.ensure_future(run_one(index, *doc)) for index, doc in enumerate(documents)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                payload = await finished
+                status = payload.get("status", "error")
+                counts[status] = counts.get(status, 0) + 1
+                if status == "error":
+                    failures.append({"index": payload["index"], "filename": payload.get("filename"), "message": payload.get("message")})
+                yield json.dumps(payload, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Tasks cancelled before they started never reach their own cleanup
+            for document in documents:
+                if document[2]:
+                    discard_spool_file(document[2])
+        elapsed = time.perf_counter() - started
+        summary = {
+            "documents": len(documents),
+            "succeeded": counts.get("success", 0),
+            "partial": counts.get("partial", 0),
+            "failed": counts.get("error", 0),
+            "failures": failures,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_sec": round(len(documents) / elapsed, 2) if elapsed > 0 else None,
+        }
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+def extract_image(path: str):
+    """OCR an uploaded image in a pool worker; returns ``{"text", "items", "timings"}``."""
+    timings = {}
+    try:
+        started = time.perf_counter()
+        img = Image.open(path)
+        img.load()
+        record_timing(timings, "decode", started)
+        img = preprocess_image(img, timings=timings)
+        ocr = ocr_with_table_band(img, timings) if OCR_TABLE_BAND else ocr_image(img, timings)
+        ocr = refine_low_confidence_fields(ocr, img, timings=timings)
+        started = time.perf_counter()
+        items = extract_items_from_image(img, ocr=ocr)
+        record_timing(timings, "items", started)
+        return {"text": ocr.text, "items": items, "timings": timings, "ocr_confidence": ocr.confidence}
+    except Exception as e:
+        print(f"Error OCRing image: {e}")
+        return {"text": "", "items": [], "timings": timings, "ocr_confidence": 0.0}
+
+
+async def extract_content(path: str, is_pdf: bool, is_image: bool):
+    """
+    Run the CPU-bound extraction (text layer, rendering, OCR, item layout) for one
+    document on the OCR pool; returns ``{"text", "items"}`` as plain, cacheable data.
+    """
+    extraction = {"text": "", "items": [], "timings": {}}
+
+    # Text layer or OCR, decided page by page
+    if is_pdf and PYMUPDF_AVAILABLE:
+        try:
+            extraction = await extract_pdf(path)
+        except Exception as e:
+            print(f"Error extracting PDF: {e}")
+
+    # OCR for images
+    if is_image and PIL_AVAILABLE and TESSERACT_AVAILABLE:
+        extraction = await run_in_ocr_pool(extract_image, path)
+
+    return extraction
+
+
+def parse_extraction(extraction, filename: str):
+    """Parse extracted text into invoice fields, preferring layout items when there are any."""
+    invoice_data = run_profiled(parse_invoice_text, extraction["text"], filename)
+    if extraction["items"]:
+        invoice_data["items"] = extraction["items"]
+    return invoice_data
+
+
+ROUTER_KEY_FIELDS = ("invoice_number", "date", "vendor", "total")
+MARKDOWN_TABLE_RULE = re.compile(r'^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$')
+MARKDOWN_DECORATION = re.compile(r'^#+\s*|\*\*|__')
+
+
+def items_match_total(invoice_data) -> float:
+    """
+    1.0 when the line item amounts add up to the total (before or after GST),
+    0.0 when they clearly do not, 0.5 when there is nothing to check.
+    """
+    total = INVOICE_PARSER.parse_amount(str(invoice_data.get("total") or "").replace("₹", ""))
+    amounts = [item["amount"] for item in invoice_data.get("items") or [] if isinstance(item.get("amount"), (int, float))]
+    if not total or not amounts:
+        return 0.5
+    items_sum = sum(amounts)
+    expected = [items_sum]
+    if invoice_data.get("gst_rate"):
+        expected.append(items_sum * (1 + invoice_data["gst_rate"] / 100))
+    tolerance = max(1.0, total * 0.02)
+    return 1.0 if any(abs(value - total) <= tolerance for value in expected) else 0.0
+
+
+def score_extraction(extraction, invoice_data) -> dict:
+    """
+    Confidence in [0, 1] that a regex extraction is right, from mean Tesseract word
+    confidence, how many key fields were found and whether the items add up.
+    """
+    ocr_confidence = extraction.get("ocr_confidence")
+    ocr = 1.0 if ocr_confidence is None else min(max(ocr_confidence / 100, 0.0), 1.0)
+    found = [name for name in ROUTER_KEY_FIELDS if str(invoice_data.get(name) or "").strip() not in {"", "0", "₹0.00"}]
+    fields = len(found) / len(ROUTER_KEY_FIELDS)
+    arithmetic = items_match_total(invoice_data)
+    return {
+        "score": round(0.4 * ocr + 0.35 * fields + 0.25 * arithmetic, 3),
+        "ocr": round(ocr, 3),
+        "fields": round(fields, 3),
+        "arithmetic": arithmetic,
+    }
 
-        # Parse invoice data from extracted text
-        invoice_data = parse_invoice_text(extracted_text, filename)
-        if items_from_image:
-            invoice_data["items"] = items_from_image
+
+def jpeg_data_url(image: "Image.Image") -> str:
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buffered.getvalue()).decode()
+
+
+def render_for_vllm(path: str, is_pdf: bool):
+    """Pool worker: JPEG data URLs of the document's pages at NuMarkdown's input size."""
+    urls = []
+    if is_pdf:
+        pdf_document = fitz.open(path)
+        try:
+            for page in list(pdf_document)[:VLLM_MAX_PDF_PAGES]:
+                dpi = min(200, VLLM_IMAGE_MAX_SIZE * 72 / max(page.rect.width, page.rect.height))
+                with render_page_image(page, dpi, grayscale=False) as img:
+                    urls.append(jpeg_data_url(img))
+        finally:
+            pdf_document.close()
+    else:
+        with Image.open(path) as img:
+            img.thumbnail((VLLM_IMAGE_MAX_SIZE, VLLM_IMAGE_MAX_SIZE))
+            urls.append(jpeg_data_url(img.convert("RGB")))
+    return urls
+
+
+def markdown_to_text(markdown: str) -> str:
+    """Flatten NuMarkdown's answer (headings, emphasis, pipe tables) into plain lines for the parser."""
+    lines = []
+    for line in markdown.splitlines():
+        line = line.strip()
+        if MARKDOWN_TABLE_RULE.match(line):
+            continue
+        if line.startswith("|"):
+            line = "  ".join(cell.strip() for cell in line.strip("|").split("|"))
+        lines.append(MARKDOWN_DECORATION.sub("", line).strip())
+    return "\n".join(lines) + "\n"
+
+
+async def extract_with_vllm(path: str, is_pdf: bool):
+    """Extract every page with NuMarkdown concurrently; returns an extraction like extract_content's."""
+    urls = await run_in_ocr_pool(render_for_vllm, path, is_pdf)
+    completions = await asyncio.gather(*(
+        VLLM_CLIENT.chat_completion({
+            "model": VLLM_MODEL,
+            "messages": [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": url}}]}],
+            "max_tokens": VLLM_MAX_TOKENS,
+            "temperature": VLLM_TEMPERATURE,
+        })
+        for url in urls
+    ))
+    answers = []
+    for completion in completions:
+        content = completion["choices"][0]["message"]["content"]
+        if "<answer>" in content:
+            content = content.split("<answer>", 1)[1].split("</answer>", 1)[0]
+        answers.append(content)
+    return {"text": markdown_to_text("\n\n".join(answers)), "items": [], "ocr_confidence": None}
+
+
+async def route_extraction(extraction, path: str, is_pdf: bool, is_image: bool, filename: str):
+    """
+    Score the Tesseract/regex extraction and, when it falls below
+    OCR_ROUTER_THRESHOLD and vLLM is configured, redo it with NuMarkdown. The
+    better-scoring result is kept and its score stored under ``confidence``.
+    """
+    started = time.perf_counter()
+    confidence = score_extraction(extraction, parse_extraction(extraction, filename))
+    confidence.update(source="tesseract", escalated=False)
+    record_timing(extraction.setdefault("timings", {}), "score", started)
+    if VLLM_CLIENT is not None and (is_pdf or is_image) and confidence["score"] < OCR_ROUTER_THRESHOLD:
+        started = time.perf_counter()
+        try:
+            escalated = await extract_with_vllm(path, is_pdf)
+        except Exception as e:
+            # Escalation is best effort: keep the Tesseract result when vLLM is unavailable
+            print(f"Error escalating to vLLM: {e}")
+            ESCALATIONS.inc(kept="failed")
+        else:
+            escalated_confidence = score_extraction(escalated, parse_extraction(escalated, filename))
+            escalated_confidence["source"] = "numarkdown"
+            if escalated_confidence["score"] >= confidence["score"]:
+                escalated["timings"] = extraction.get("timings", {})
+                extraction, confidence = escalated, escalated_confidence
+            confidence["escalated"] = True
+            ESCALATIONS.inc(kept=confidence["source"])
+        record_timing(extraction.setdefault("timings", {}), "vllm", started)
+    extraction["confidence"] = confidence
+    return extraction
+
+
+def build_payload(extraction, filename: str, is_pdf: bool, timings: dict = None):
+    """Parse extracted text into the /upload response payload."""
+    try:
+        extracted_text = extraction["text"]
+        started = time.perf_counter()
+        invoice_data = parse_extraction(extraction, filename)
+        record_timing(timings, "parse", started)
+        confidence = extraction.get("confidence")
 
         def has_useful_data(data):
             for value in data.values():
@@ -624,105 +2336,127 @@ async def upload_file(file: UploadFile = File(...)):
                 note = "PyMuPDF is not installed, so PDF text could not be extracted."
             elif TESSERACT_AVAILABLE:
                 note = "OCR is enabled, but no readable text was detected."
-            return JSONResponse({
+            return {
                 "status": "error",
                 "message": "No text could be extracted from the file.",
                 "filename": filename,
                 "note": note,
                 "extracted_data": invoice_data
-            })
+            }
 
         status = "success" if has_useful_data(invoice_data) else "partial"
         message = "Invoice data extracted" if status == "success" else "Text extracted, but invoice fields were not detected."
+        failed_pages = extraction.get("failed_pages")
+        if failed_pages:
+            status = "partial"
+            message = f"Page(s) {', '.join(map(str, failed_pages))} could not be OCRed; the extraction is incomplete."
 
+        if confidence and confidence.get("source") == "numarkdown":
+            note = "Low OCR confidence, so this invoice was extracted with NuMarkdown-8B-Thinking"
+        else:
+            note = "For better accuracy, configure vLLM backend with NuMarkdown-8B-Thinking model"
         response_payload = {
             "status": status,
             "message": message,
             "filename": filename,
-            "note": "For better accuracy, configure vLLM backend with NuMarkdown-8B-Thinking model",
+            "note": note,
             "extracted_data": invoice_data,
-            "parser_version": "v6-gst-rate"
+            "confidence": confidence,
+            "parser_version": PARSER_VERSION
         }
+        if failed_pages:
+            response_payload["failed_pages"] = failed_pages
         if os.environ.get("OCR_DEBUG") == "1":
             response_payload["debug_text"] = extracted_text[:4000]
-        return JSONResponse(response_payload)
+            response_payload["timings_ms"] = {step: round(elapsed, 2) for step, elapsed in (timings or {}).items()}
+        return response_payload
 
     except Exception as e:
-        return JSONResponse({
-            "status": "error",
-            "message": f"Error processing file: {str(e)}",
-            "filename": file.filename,
-            "extracted_data": {
-                "invoice_number": "",
-                "date": "",
-                "due_date": "",
-                "vendor": "",
-                "total": "0",
-                "description": "Error extracting data",
-                "notes": f"Could not process file: {str(e)}"
-            }
-        })
+        return error_payload(filename, f"Error processing file: {str(e)}", f"Could not process file: {str(e)}")
 
-def parse_invoice_text(text: str, filename: str):
+class InvoiceTextParser:
     """
-    Parse invoice data from extracted text using regex patterns.
+    Regex-based invoice field parser. Patterns are compiled once at construction
+    and every line is classified once by a single multi-label matcher, so the
+    same instance can be reused across millions of stored OCR texts.
     """
-    data = {
-        "invoice_number": "",
-        "date": "",
-        "due_date": "",
-        "vendor": "",
-        "total": "0",
-        "description": "",
-        "notes": "",
-        "items": []
-    }
 
-    if not text:
-        return data
-
-    # Extract invoice number - look for patterns like "Invoice No.: 398", "INV-123", etc.
-    invoice_patterns = [
+    INVOICE_PATTERNS = [
         r'Invoice\s+No\.?\s*:?\s*(\d+)',
         r'Invoice\s+#\s*(\d+)',
         r'INV[-\s]?(\d+)',
         r'Invoice\s+Number\s*:?\s*([A-Z0-9-]+)'
     ]
-    for pattern in invoice_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            data["invoice_number"] = f"INV-{match.group(1)}"
-            break
-
-    # Extract date - look for patterns like "Date: 16-11-2024", "16/11/2024", etc.
-    date_patterns = [
+    DATE_PATTERNS = [
         r'Date\s*:?\s*(\d{1,2}[-/]\d{1,2}[-/]\d{4})',
         r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})'
     ]
-    for pattern in date_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            date_str = match.group(1)
-            # Convert to YYYY-MM-DD format
-            if '-' in date_str:
-                parts = date_str.split('-')
-            else:
-                parts = date_str.split('/')
-
-            if len(parts) == 3:
-                day, month, year = parts
-                if len(year) == 4:
-                    data["date"] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            break
+    NUMBER = r'[0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?'
+    VENDOR_SKIP_WORDS = ['invoice', 'original', 'tax', 'gst', 'phone', 'email']
+    UNIT_TOKENS = {
+        "nos", "no", "box", "rol", "roll", "pcs", "pkt", "pack", "set",
+        "kg", "g", "gm", "ltr", "l", "litre", "meter", "m"
+    }
+    TOTAL_LABEL_PRIORITY = [
+        ("grand total", 4),
+        ("total amount", 4),
+        ("total payable", 4),
+        ("amount due", 4),
+        ("amount payable", 4),
+        ("net total", 4),
+        ("net amount", 4),
+        ("balance", 3),
+        ("invoice total", 3),
+        ("total", 3),
+        ("sub total", 1),
+        ("subtotal", 1),
+    ]
+    # Labels whose first matching line supplies the subtotal/tax breakdown
+    BREAKDOWN_LABELS = {
+        "subtotal": {"sub total", "subtotal"},
+        "cgst": {"cgst"},
+        "sgst": {"sgst"},
+        "igst": {"igst"},
+    }
+    # Table header/footer markers for the fallback item scan
+    TABLE_LABELS = {"item", "amount", "total"}
+
+    def __init__(self):
+        flags = re.IGNORECASE
+        self.invoice_patterns = [re.compile(p, flags) for p in self.INVOICE_PATTERNS]
+        self.date_patterns = [re.compile(p, flags) for p in self.DATE_PATTERNS]
+        self.vendor_code_pattern = re.compile(r'^[A-Z0-9-]+\s*$')
+        self.currency_pattern = re.compile(r'(?:₹|Rs\.?|INR)\s*(' + self.NUMBER + ')', flags)
+        self.plain_amount_pattern = re.compile('(' + self.NUMBER + ')')
+        self.number_token_pattern = re.compile(self.NUMBER)
+        self.percent_suffix_pattern = re.compile(r'\(\s*\d+(\.\d+)?\s*%\s*\)')
+        self.whitespace_pattern = re.compile(r'\s+')
+        self.item_start_pattern = re.compile(r'^\d+\s+')
+        self.item_gst_pattern = re.compile(r'([0-9]+(?:\.[0-9]{1,2})?)\s*\(?\s*18\.0?\s*%?\s*\)?')
+        self.item_code_pattern = re.compile(r'[A-Z0-9]{4,}')
+        self.table_split_pattern = re.compile(r'(?<!\d)(\d{1,2})\s+')
+        self.gstin_pattern = re.compile(r'GSTIN\s*:?\s*([A-Z0-9]+)', flags)
+        self.rate_patterns = {
+            name: re.compile(name + r'\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', flags)
+            for name in ("cgst", "sgst", "igst", "gst")
+        }
 
-    # Extract vendor/company name - usually at the top
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    for line in lines[:10]:  # Check first 10 lines
-        if line and len(line) > 3 and not any(skip in line.lower() for skip in ['invoice', 'original', 'tax', 'gst', 'phone', 'email']):
-            if not re.match(r'^[A-Z0-9-]+\s*$', line):  # Not just numbers/codes
-                data["vendor"] = line
-                break
+        # One lookahead alternation finds every label occurrence in a line. Longer
+        # labels are tried first, and each match also implies the labels it
+        # contains ("grand total" implies "total"), which reproduces plain
+        # substring checks for every label at once.
+        labels = {label for label, _ in self.TOTAL_LABEL_PRIORITY}
+        for group in self.BREAKDOWN_LABELS.values():
+            labels |= group
+        labels |= self.TABLE_LABELS
+        ordered = sorted(labels, key=lambda label: (-len(label), label))
+        self.label_pattern = re.compile('(?=(' + '|'.join(re.escape(label) for label in ordered) + '))')
+        self.implied_labels = {
+            label: frozenset(other for other in labels if other in label)
+            for label in labels
+        }
 
+    @staticmethod
     def parse_amount(value: str):
         cleaned = value.replace(',', '').replace(' ', '')
         try:
@@ -730,59 +2464,60 @@ def parse_invoice_text(text: str, filename: str):
         except ValueError:
             return None
 
-    currency_pattern = r'(?:₹|Rs\.?|INR)\s*([0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?)'
-    plain_amount_pattern = r'([0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?)'
+    def classify_line(self, lower: str):
+        """Return the set of known labels contained in a lower-cased line."""
+        found = set()
+        for match in self.label_pattern.finditer(lower):
+            found |= self.implied_labels[match.group(1)]
+        return found
+
+    def total_priority(self, labels):
+        for label, priority in self.TOTAL_LABEL_PRIORITY:
+            if label in labels:
+                return priority
+        return None
 
-    def extract_amounts(line: str, allow_plain: bool = False):
+    def extract_amounts(self, line: str, allow_plain: bool = False):
         amounts = []
-        for match in re.finditer(currency_pattern, line, re.IGNORECASE):
-            amount = parse_amount(match.group(1))
+        for match in self.currency_pattern.finditer(line):
+            amount = self.parse_amount(match.group(1))
             if amount is not None:
                 amounts.append(amount)
-        if allow_plain and not amounts:
-            for match in re.finditer(plain_amount_pattern, line):
-                if '-' in line or '/' in line:
-                    continue
-                amount = parse_amount(match.group(1))
+        if allow_plain and not amounts and '-' not in line and '/' not in line:
+            for match in self.plain_amount_pattern.finditer(line):
+                amount = self.parse_amount(match.group(1))
                 if amount is not None:
                     amounts.append(amount)
         return amounts
 
-    def is_number_token(token: str):
-        return re.fullmatch(r'[0-9]{1,3}(?:[, ]?[0-9]{3})*(?:\.\d{1,2})?', token) is not None
-
-    def parse_float_token(token: str):
-        return parse_amount(token)
-
-    unit_tokens = {
-        "nos", "no", "box", "rol", "roll", "pcs", "pkt", "pack", "set",
-        "kg", "g", "gm", "ltr", "l", "litre", "meter", "m"
-    }
+    def is_number_token(self, token: str):
+        return self.number_token_pattern.fullmatch(token) is not None
 
-    def parse_item_line(line: str):
-        cleaned = re.sub(r'\(\s*\d+(\.\d+)?\s*%\s*\)', '', line)
+    def parse_item_line(self, line: str):
+        cleaned = self.percent_suffix_pattern.sub('', line)
         cleaned = cleaned.replace('₹', ' ').replace('Rs.', ' ').replace('INR', ' ')
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-        if not re.match(r'^\d+\s+', cleaned):
+        cleaned = self.whitespace_pattern.sub(' ', cleaned).strip()
+        if not self.item_start_pattern.match(cleaned):
             return None
 
         tokens = cleaned.split()
         item_index = tokens[0]
         tokens = tokens[1:]
+        numeric_flags = [self.is_number_token(token) for token in tokens]
 
         unit_index = None
         for idx, token in enumerate(tokens):
-            if token.lower() in unit_tokens:
+            if token.lower() in self.UNIT_TOKENS:
                 unit_index = idx
                 break
 
         qty = None
         unit = None
-        if unit_index is not None and unit_index > 0 and is_number_token(tokens[unit_index - 1]):
-            qty = parse_float_token(tokens[unit_index - 1])
+        if unit_index is not None and unit_index > 0 and numeric_flags[unit_index - 1]:
+            qty = self.parse_amount(tokens[unit_index - 1])
             unit = tokens[unit_index]
 
-        numeric_tokens = [parse_float_token(t) for t in tokens if is_number_token(t)]
+        numeric_tokens = [self.parse_amount(t) for t, is_number in zip(tokens, numeric_flags) if is_number]
         numeric_tokens = [n for n in numeric_tokens if n is not None]
 
         amount = None
@@ -799,16 +2534,16 @@ def parse_invoice_text(text: str, filename: str):
                 rate = numeric_tokens[0]
 
         # Attempt to capture GST value (e.g. "9.00 (18.0%)")
-        gst_match = re.search(r'([0-9]+(?:\.[0-9]{1,2})?)\s*\(?\s*18\.0?\s*%?\s*\)?', line)
+        gst_match = self.item_gst_pattern.search(line)
         if gst_match:
-            gst_value = parse_amount(gst_match.group(1))
+            gst_value = self.parse_amount(gst_match.group(1))
 
         item_name_end = None
         if unit_index is not None:
             item_name_end = max(unit_index - 1, 0)
         else:
-            for idx, token in enumerate(tokens):
-                if is_number_token(token):
+            for idx, is_number in enumerate(numeric_flags):
+                if is_number:
                     item_name_end = idx
                     break
 
@@ -816,7 +2551,7 @@ def parse_invoice_text(text: str, filename: str):
             item_name_end = len(tokens)
 
         name_tokens = tokens[:item_name_end]
-        name_tokens = [t for t in name_tokens if not re.fullmatch(r'[A-Z0-9]{4,}', t)]
+        name_tokens = [t for t in name_tokens if not self.item_code_pattern.fullmatch(t)]
         item_name = " ".join(name_tokens).strip()
         if not item_name:
             item_name = f"Item {item_index}"
@@ -847,82 +2582,8 @@ def parse_invoice_text(text: str, filename: str):
             "gst": gst_value
         }
 
-    label_priority = [
-        ("grand total", 4),
-        ("total amount", 4),
-        ("total payable", 4),
-        ("amount due", 4),
-        ("amount payable", 4),
-        ("net total", 4),
-        ("net amount", 4),
-        ("balance", 3),
-        ("invoice total", 3),
-        ("total", 3),
-        ("sub total", 1),
-        ("subtotal", 1),
-    ]
-
-    candidates = []
-    for idx, line in enumerate(lines):
-        lower = line.lower()
-        matched_priority = None
-        for label, priority in label_priority:
-            if label in lower:
-                matched_priority = priority
-                break
-
-        if matched_priority is None:
-            continue
-
-        amounts = extract_amounts(line, allow_plain=True)
-        if not amounts and idx + 1 < len(lines):
-            amounts = extract_amounts(lines[idx + 1], allow_plain=True)
-        for amount in amounts:
-            candidates.append((matched_priority, amount))
-
-    def find_label_amount(labels):
-        for idx, line in enumerate(lines):
-            lower = line.lower()
-            if any(label in lower for label in labels):
-                amounts = extract_amounts(line, allow_plain=True)
-                if not amounts and idx + 1 < len(lines):
-                    amounts = extract_amounts(lines[idx + 1], allow_plain=True)
-                if amounts:
-                    return max(amounts)
-        return None
-
-    if candidates:
-        _, best_amount = max(candidates, key=lambda item: (item[0], item[1]))
-        data["total"] = f"₹{best_amount:.2f}"
-    else:
-        fallback_amounts = []
-        for line in lines:
-            fallback_amounts.extend(extract_amounts(line, allow_plain=False))
-        if fallback_amounts:
-            data["total"] = f"₹{max(fallback_amounts):.2f}"
-
-    subtotal_amount = find_label_amount(["sub total", "subtotal"])
-    cgst_amount = find_label_amount(["cgst"])
-    sgst_amount = find_label_amount(["sgst"])
-    igst_amount = find_label_amount(["igst"])
-
-    if subtotal_amount and any([cgst_amount, sgst_amount, igst_amount]):
-        computed_total = subtotal_amount + (cgst_amount or 0) + (sgst_amount or 0) + (igst_amount or 0)
-        current_total_value = parse_amount(data["total"].replace("₹", "")) if data["total"] else None
-        if current_total_value is None or computed_total > current_total_value * 1.02:
-            data["total"] = f"₹{computed_total:.2f}"
-
-    # Extract line items
-    items = []
-    for line in lines:
-        item = parse_item_line(line)
-        if not item or not item.get("description"):
-            continue
-        if item.get("amount") is None and item.get("rate") is None:
-            continue
-        items.append(item)
-
-    if items:
+    @staticmethod
+    def dedupe_items(items):
         seen = set()
         unique_items = []
         for item in items:
@@ -935,107 +2596,215 @@ def parse_invoice_text(text: str, filename: str):
             unique_items.sort(key=lambda entry: int(entry.get("index", 0)))
         except Exception:
             pass
-        data["items"] = unique_items
-    else:
-        # Fallback: attempt to parse items from table text region
-        start_idx = None
-        end_idx = None
+        return unique_items
+
+    def parse(self, text: str, filename: str):
+        """
+        Parse invoice data from extracted text using regex patterns.
+        """
+        data = {
+            "invoice_number": "",
+            "date": "",
+            "due_date": "",
+            "vendor": "",
+            "total": "0",
+            "description": "",
+            "notes": "",
+            "items": []
+        }
+
+        if not text:
+            return data
+
+        # Extract invoice number - look for patterns like "Invoice No.: 398", "INV-123", etc.
+        for pattern in self.invoice_patterns:
+            match = pattern.search(text)
+            if match:
+                data["invoice_number"] = f"INV-{match.group(1)}"
+                break
+
+        # Extract date - look for patterns like "Date: 16-11-2024", "16/11/2024", etc.
+        for pattern in self.date_patterns:
+            match = pattern.search(text)
+            if match:
+                date_str = match.group(1)
+                # Convert to YYYY-MM-DD format
+                parts = date_str.split('-') if '-' in date_str else date_str.split('/')
+                if len(parts) == 3:
+                    day, month, year = parts
+                    if len(year) == 4:
+                        data["date"] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+                break
+
+        # Extract vendor/company name - usually at the top
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        for line in lines[:10]:  # Check first 10 lines
+            if line and len(line) > 3 and not any(skip in line.lower() for skip in self.VENDOR_SKIP_WORDS):
+                if not self.vendor_code_pattern.match(line):  # Not just numbers/codes
+                    data["vendor"] = line
+                    break
+
+        # Single pass over the lines: classify labels once and collect total
+        # candidates plus the first subtotal/CGST/SGST/IGST amounts.
+        amounts_cache = {}
+
+        def labelled_amounts(idx):
+            if idx not in amounts_cache:
+                amounts = self.extract_amounts(lines[idx], allow_plain=True)
+                if not amounts and idx + 1 < len(lines):
+                    amounts = self.extract_amounts(lines[idx + 1], allow_plain=True)
+                amounts_cache[idx] = amounts
+            return amounts_cache[idx]
+
+        line_labels = []
+        candidates = []
+        breakdown = {name: None for name in self.BREAKDOWN_LABELS}
         for idx, line in enumerate(lines):
-            lower = line.lower()
-            if start_idx is None and ("item" in lower and "amount" in lower):
-                start_idx = idx + 1
+            labels = self.classify_line(line.lower())
+            line_labels.append(labels)
+            if not labels:
                 continue
-            if start_idx is not None and "total" in lower:
-                end_idx = idx
-                break
-        table_lines = lines[start_idx:end_idx] if start_idx is not None else lines
-        table_text = " ".join(table_lines)
-        chunks = re.split(r'(?<!\d)(\d{1,2})\s+', table_text)
-        fallback_items = []
-        for i in range(1, len(chunks), 2):
-            item_text = f"{chunks[i]} {chunks[i + 1]}".strip()
-            item = parse_item_line(item_text)
-            if item and item.get("description") and item.get("amount") is not None:
-                fallback_items.append(item)
-        if fallback_items:
-            seen = set()
-            unique_items = []
-            for item in fallback_items:
-                key = (item.get("description"), round(item.get("amount", 0), 2))
-                if key in seen:
+
+            priority = self.total_priority(labels)
+            if priority is not None:
+                for amount in labelled_amounts(idx):
+                    candidates.append((priority, amount))
+
+            for name, group in self.BREAKDOWN_LABELS.items():
+                if breakdown[name] is None and not labels.isdisjoint(group):
+                    amounts = labelled_amounts(idx)
+                    if amounts:
+                        breakdown[name] = max(amounts)
+
+        if candidates:
+            _, best_amount = max(candidates, key=lambda item: (item[0], item[1]))
+            data["total"] = f"₹{best_amount:.2f}"
+        else:
+            fallback_amounts = []
+            for line in lines:
+                fallback_amounts.extend(self.extract_amounts(line, allow_plain=False))
+            if fallback_amounts:
+                data["total"] = f"₹{max(fallback_amounts):.2f}"
+
+        subtotal_amount = breakdown["subtotal"]
+        cgst_amount = breakdown["cgst"]
+        sgst_amount = breakdown["sgst"]
+        igst_amount = breakdown["igst"]
+
+        if subtotal_amount and any([cgst_amount, sgst_amount, igst_amount]):
+            computed_total = subtotal_amount + (cgst_amount or 0) + (sgst_amount or 0) + (igst_amount or 0)
+            current_total_value = self.parse_amount(data["total"].replace("₹", "")) if data["total"] else None
+            if current_total_value is None or computed_total > current_total_value * 1.02:
+                data["total"] = f"₹{computed_total:.2f}"
+
+        # Extract line items
+        items = []
+        for line in lines:
+            item = self.parse_item_line(line)
+            if not item or not item.get("description"):
+                continue
+            if item.get("amount") is None and item.get("rate") is None:
+                continue
+            items.append(item)
+
+        if items:
+            data["items"] = self.dedupe_items(items)
+        else:
+            # Fallback: attempt to parse items from table text region
+            start_idx = None
+            end_idx = None
+            for idx, labels in enumerate(line_labels):
+                if start_idx is None and ("item" in labels and "amount" in labels):
+                    start_idx = idx + 1
                     continue
-                seen.add(key)
-                unique_items.append(item)
+                if start_idx is not None and "total" in labels:
+                    end_idx = idx
+                    break
+            table_lines = lines[start_idx:end_idx] if start_idx is not None else lines
+            table_text = " ".join(table_lines)
+            chunks = self.table_split_pattern.split(table_text)
+            fallback_items = []
+            for i in range(1, len(chunks), 2):
+                item_text = f"{chunks[i]} {chunks[i + 1]}".strip()
+                item = self.parse_item_line(item_text)
+                if item and item.get("description") and item.get("amount") is not None:
+                    fallback_items.append(item)
+            if fallback_items:
+                data["items"] = self.dedupe_items(fallback_items)
+
+        # Extract GSTIN if available
+        gstin_match = self.gstin_pattern.search(text)
+        if gstin_match:
+            data["notes"] = f"GSTIN: {gstin_match.group(1)}"
+
+        # Detect GST rate
+        def parse_percent(match):
             try:
-                unique_items.sort(key=lambda entry: int(entry.get("index", 0)))
+                return float(match.group(1))
             except Exception:
-                pass
-            data["items"] = unique_items
+                return None
+
+        lower_text = text.lower()
+        has_gst_tokens = any(token in lower_text for token in ["gst", "cgst", "sgst", "igst"])
+        cgst_rate = None
+        sgst_rate = None
+        igst_rate = None
+        gst_rate = None
+
+        cgst_match = self.rate_patterns["cgst"].search(text)
+        sgst_match = self.rate_patterns["sgst"].search(text)
+        igst_match = self.rate_patterns["igst"].search(text)
+        if cgst_match:
+            cgst_rate = parse_percent(cgst_match)
+        if sgst_match:
+            sgst_rate = parse_percent(sgst_match)
+        if igst_match:
+            igst_rate = parse_percent(igst_match)
+
+        if igst_rate is not None:
+            gst_rate = igst_rate
+        elif cgst_rate is not None and sgst_rate is not None:
+            gst_rate = cgst_rate + sgst_rate
+        else:
+            gst_match = self.rate_patterns["gst"].search(text)
+            if gst_match:
+                gst_rate = parse_percent(gst_match)
 
-    # Extract GSTIN if available
-    gstin_match = re.search(r'GSTIN\s*:?\s*([A-Z0-9]+)', text, re.IGNORECASE)
-    if gstin_match:
-        data["notes"] = f"GSTIN: {gstin_match.group(1)}"
+        if gst_rate is None and not has_gst_tokens:
+            gst_rate = 0
 
-    # Detect GST rate
-    def parse_percent(match):
-        try:
-            return float(match.group(1))
-        except Exception:
-            return None
+        if gst_rate is not None:
+            data["gst_rate"] = gst_rate
+            data["has_gst"] = gst_rate > 0
+        else:
+            data["has_gst"] = has_gst_tokens
 
-    lower_text = text.lower()
-    has_gst_tokens = any(token in lower_text for token in ["gst", "cgst", "sgst", "igst"])
-    cgst_rate = None
-    sgst_rate = None
-    igst_rate = None
-    gst_rate = None
-
-    cgst_match = re.search(r'cgst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
-    sgst_match = re.search(r'sgst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
-    igst_match = re.search(r'igst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
-    if cgst_match:
-        cgst_rate = parse_percent(cgst_match)
-    if sgst_match:
-        sgst_rate = parse_percent(sgst_match)
-    if igst_match:
-        igst_rate = parse_percent(igst_match)
-
-    if igst_rate is not None:
-        gst_rate = igst_rate
-    elif cgst_rate is not None and sgst_rate is not None:
-        gst_rate = cgst_rate + sgst_rate
-    else:
-        gst_match = re.search(r'gst\s*@?\s*([0-9]+(?:\.[0-9]+)?)\s*%', text, re.IGNORECASE)
-        if gst_match:
-            gst_rate = parse_percent(gst_match)
+        # Set description from vendor or filename
+        if data["vendor"]:
+            data["description"] = f"Invoice from {data['vendor']}"
+        else:
+            data["description"] = f"Scanned invoice: {filename}"
+
+        # Calculate due date (30 days from invoice date if date is available)
+        if data["date"]:
+            try:
+                invoice_date = datetime.strptime(data["date"], "%Y-%m-%d")
+                due_date = invoice_date + timedelta(days=30)
+                data["due_date"] = due_date.strftime("%Y-%m-%d")
+            except ValueError:
+                pass
 
-    if gst_rate is None and not has_gst_tokens:
-        gst_rate = 0
+        return data
 
-    if gst_rate is not None:
-        data["gst_rate"] = gst_rate
-        data["has_gst"] = gst_rate > 0
-    else:
-        data["has_gst"] = has_gst_tokens
 
-    # Set description from vendor or filename
-    if data["vendor"]:
-        data["description"] = f"Invoice from {data['vendor']}"
-    else:
-        data["description"] = f"Scanned invoice: {filename}"
+INVOICE_PARSER = InvoiceTextParser()
 
-    # Calculate due date (30 days from invoice date if date is available)
-    if data["date"]:
-        try:
-            from datetime import datetime, timedelta
-            invoice_date = datetime.strptime(data["date"], "%Y-%m-%d")
-            due_date = invoice_date + timedelta(days=30)
-            data["due_date"] = due_date.strftime("%Y-%m-%d")
-        except:
-            pass
 
-    return data
+def parse_invoice_text(text: str, filename: str):
+    """
+    Parse invoice data from extracted text using regex patterns.
+    """
+    return INVOICE_PARSER.parse(text, filename)
 
 if __name__ == "__main__":
     print("🚀 Starting Invoice OCR Server...")
@@ -1043,5 +2812,12 @@ if __name__ == "__main__":
     print("🎨 Theme: CreditFlow Pro Light")
     if not TESSERACT_AVAILABLE:
         print("⚠️  Tesseract OCR not detected - image/scanned PDF OCR will fail")
-    print("⚠️  Note: vLLM backend not configured - returning demo data")
+    if VLLM_CLIENT is not None:
+        print(f"🧭 Escalating extractions below confidence {OCR_ROUTER_THRESHOLD} to {VLLM_API_URL}")
+    else:
+        print("⚠️  Note: vLLM backend not configured (set VLLM_API_URL) - Tesseract results only")
+    print(f"🧵 OCR workers: {OCR_WORKERS} (max {OCR_MAX_PENDING} documents in flight)")
+    print(f"🔤 OCR engine: {'tesserocr (in-process)' if USE_TESSEROCR else 'tesseract binary'}")
+    if OCR_PROFILE_SAMPLE_RATE > 0 or OCR_PROFILE_SLOW_MS > 0:
+        print(f"🔬 Profiling uploads (sample rate {OCR_PROFILE_SAMPLE_RATE}, slower than {OCR_PROFILE_SLOW_MS} ms) into {PROFILE_RING.directory}")
     uvicorn.run(app, host="0.0.0.0", port=7860)
@@ -9,6 +9,7 @@ python3 -m vllm.entrypoints.openai.api_server \
     --port 8000 \
     --host 0.0.0.0 \
     --max-model-len 20000 \
+    --max-num-seqs ${VLLM_MAX_NUM_SEQS:-16} \
     --gpu-memory-utilization 0.95 \
     --disable-log-requests \
     --tensor-parallel-size 1 \
@@ -17,38 +18,28 @@ python3 -m vllm.entrypoints.openai.api_server \
 VLLM_PID=$!
 echo "vLLM started with PID: $VLLM_PID"
 
-# More aggressive waiting with health checks
-echo "Waiting for vLLM server to start (this may take 5-10 minutes)..."
-for i in {1..180}; do  # Wait up to 6 minutes
-    if curl -s --connect-timeout 5 http://localhost:8000/health > /dev/null 2>&1; then
-        echo "✓ vLLM health check passed!"
-        break
-    elif curl -s --connect-timeout 5 http://localhost:8000/v1/models > /dev/null 2>&1; then
-        echo "✓ vLLM server is ready!"
-        break
-    fi
-    
-    # Show progress every 10 seconds
-    if [ $((i % 10)) -eq 0 ]; then
-        echo "Still waiting... ($i/180) - checking vLLM process"
-        if ! ps -p $VLLM_PID > /dev/null; then
-            echo "❌ vLLM process died! Checking logs:"
-            tail -20 $HOME/app/vllm.log
-            exit 1
+# Gradio starts right away; the app shows a "model is loading" message and warms
+# its example cache once vLLM answers. This loop only reports progress; the
+# wait at the end stops the Space if vLLM dies.
+echo "Waiting for vLLM server to start in the background (this may take 5-10 minutes)..."
+watch_vllm() {
+    for i in {1..450}; do  # Report for up to 15 minutes
+        if curl -s --connect-timeout 5 http://localhost:8000/health > /dev/null 2>&1; then
+            echo "✅ vLLM server is ready!"
+            return 0
         fi
-    fi
-    sleep 2
-done
 
-# Final check
-if ! curl -s http://localhost:8000/v1/models > /dev/null; then
-    echo "❌ vLLM server failed to start after 6 minutes!"
-    echo "Last 50 lines of vLLM logs:"
+        # Show progress every 20 seconds
+        if [ $((i % 10)) -eq 0 ]; then
+            echo "Still waiting for vLLM... ($i/450)"
+        fi
+        sleep 2
+    done
+    echo "⚠️ vLLM is still not answering after 15 minutes. Last 50 lines of vLLM logs:"
     tail -50 $HOME/app/vllm.log
-    exit 1
-fi
+}
+watch_vllm &
 
-echo "✅ vLLM server is ready!"
 echo "=== Starting Gradio App ==="
 echo "Port 7860 status before launching Gradio:"
 netstat -tuln | grep :7860 || echo "Port 7860 is free"
@@ -69,4 +60,18 @@ ls -la $HOME/app/
 
 echo "=== Starting Gradio App ==="
 echo "Running crash debug version..."
-python3 $HOME/app/app.py
\ No newline at end of file
+python3 $HOME/app/app.py &
+APP_PID=$!
+
+# Whichever of vLLM and Gradio exits first takes the Space down with it
+wait -n $VLLM_PID $APP_PID
+STATUS=$?
+if ! ps -p $VLLM_PID > /dev/null; then
+    echo "❌ vLLM process died! Checking logs:"
+    tail -50 $HOME/app/vllm.log
+    kill $APP_PID 2>/dev/null
+else
+    echo "❌ Gradio app exited with status $STATUS"
+    kill $VLLM_PID 2>/dev/null
+fi
+exit 1
\ No newline at end of file
@@ -0,0 +1,124 @@
+import importlib.util
+import os
+import shlex
+import threading
+
+# tesserocr is an extension module that loads libtesseract, so it is imported on first use
+TESSEROCR_AVAILABLE = importlib.util.find_spec("tesserocr") is not None
+
+TSV_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text"]
+
+
+def parse_tesseract_config(config: str):
+    """
+    Split a pytesseract-style config string (``--oem 1 --psm 6 -l eng -c name=value``)
+    into ``(lang, oem, psm, variables)``; missing options come back as None.
+    """
+    lang, oem, psm, variables = None, None, None, {}
+    tokens = shlex.split(config or "")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token in ("--oem", "--psm", "-l", "-c") and value is not None:
+            if token == "--oem":
+                oem = int(value)
+            elif token == "--psm":
+                psm = int(value)
+            elif token == "-l":
+                lang = value
+            elif "=" in value:
+                name, _, setting = value.partition("=")
+                variables[name] = setting
+            i += 2
+        else:
+            i += 1
+    return lang, oem, psm, variables
+
+
+def tsv_to_data(tsv: str):
+    """Turn Tesseract's TSV text into the dict ``pytesseract.image_to_data(output_type=DICT)`` returns."""
+    data = {name: [] for name in TSV_COLUMNS}
+    for line in tsv.splitlines():
+        fields = line.split("\t")
+        if len(fields) < len(TSV_COLUMNS) - 1 or not fields[0].isdigit():
+            continue
+        fields += [""] * (len(TSV_COLUMNS) - len(fields))
+        for name, value in zip(TSV_COLUMNS[:10], fields[:10]):
+            data[name].append(int(value))
+        data["conf"].append(float(fields[10]))
+        data["text"].append(fields[11])
+    return data
+
+
+class TesseractEnginePool:
+    """
+    Warm Tesseract engines reached through the C API (tesserocr), reused across
+    calls so the LSTM model is loaded once per engine instead of once per
+    subprocess. Images go in from memory. Engines are keyed by the settings
+    that can only be fixed at init (language, OEM, ``-c`` variables); the page
+    segmentation mode is set per call. Each thread checks out its own engine.
+    """
+
+    def __init__(self, tessdata_path: str = None, default_lang: str = "eng"):
+        self.tessdata_path = tessdata_path
+        self.default_lang = default_lang
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.engines_created = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("TESSDATA_PREFIX") or None, os.environ.get("TESSERACT_LANG", "eng"))
+
+    def _create(self, lang, oem, variables):
+        import tesserocr
+        kwargs = {"lang": lang, "init": True, "variables": variables}
+        if oem is not None:
+            kwargs["oem"] = oem
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        self.engines_created += 1
+        return engine
+
+    def _key(self, lang, oem, variables):
+        return lang or self.default_lang, oem, tuple(sorted(variables.items()))
+
+    def warm(self, config: str = ""):
+        """Create and park an engine for ``config`` ahead of the first call."""
+        lang, oem, _, variables = parse_tesseract_config(config)
+        key = self._key(lang, oem, variables)
+        engine = self._create(key[0], oem, variables)
+        with self._lock:
+            self._idle.setdefault(key, []).append(engine)
+
+    def image_to_data(self, image, config: str = ""):
+        import tesserocr
+        lang, oem, psm, variables = parse_tesseract_config(config)
+        key = self._key(lang, oem, variables)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            engine = idle.pop() if idle else None
+        if engine is None:
+            engine = self._create(key[0], oem, variables)
+        try:
+            # Same default as the tesseract CLI when no --psm is given
+            engine.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+            engine.SetImage(image)
+            data = tsv_to_data(engine.GetTSVText(0))
+            engine.Clear()
+        except Exception:
+            engine.End()
+            raise
+        with self._lock:
+            self._idle[key].append(engine)
+        return data
+
+    def close(self):
+        with self._lock:
+            engines = [engine for idle in self._idle.values() for engine in idle]
+            self._idle.clear()
+        for engine in engines:
+            engine.End()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+VLLM_API_URL = os.environ.get("VLLM_API_URL", "http://localhost:8000")
+# Keep in step with vLLM's --max-num-seqs so every request we send can join its running batch
+VLLM_MAX_NUM_SEQS = int(os.environ.get("VLLM_MAX_NUM_SEQS", "16"))
+VLLM_CONNECT_TIMEOUT = float(os.environ.get("VLLM_CONNECT_TIMEOUT", "10"))
+VLLM_READ_TIMEOUT = float(os.environ.get("VLLM_READ_TIMEOUT", "300"))
+
+
+class VllmError(Exception):
+    pass
+
+
+class _LoopState:
+    def __init__(self, max_in_flight, connect_timeout, read_timeout):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_in_flight, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout),
+        )
+
+
+class _SharedSlots:
+    """
+    Counting semaphore shared by every event loop in the process. Waiters park
+    on a future of their own loop and are handed freed slots first come,
+    first served, so no thread blocks while waiting.
+    """
+
+    def __init__(self, size):
+        self._free = size
+        self._waiters = deque()  # (loop, future)
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over:
+                self.release()  # the slot arrived just as we were cancelled; pass it on
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            loop, future = self._waiters.popleft()
+        try:
+            loop.call_soon_threadsafe(_hand_over, future)
+        except RuntimeError:
+            self.release()  # the waiter's loop is closed
+
+
+def _hand_over(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class VllmClient:
+    """
+    Shared async client for the vLLM OpenAI-compatible server.
+
+    Connections are kept alive and reused, and at most ``max_in_flight``
+    requests are sent at once across the whole process; callers beyond that
+    wait here instead of queueing inside vLLM. aiohttp sessions belong to one
+    event loop, so one session is kept per loop (Gradio's loop, plus any
+    ``asyncio.run`` used by background threads). The counters are updated
+    from all of those threads under a lock.
+    """
+
+    def __init__(self, base_url=VLLM_API_URL, max_in_flight=VLLM_MAX_NUM_SEQS,
+                 connect_timeout=VLLM_CONNECT_TIMEOUT, read_timeout=VLLM_READ_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        # Running totals for throughput tracking
+        self.completed = 0
+        self.completion_tokens = 0
+        self._counter_lock = threading.Lock()
+        self._slots = _SharedSlots(max_in_flight)
+        self._states = weakref.WeakKeyDictionary()
+
+    def _count(self, name: str, amount: int):
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None or state.session.closed:
+            state = _LoopState(self.max_in_flight, self.connect_timeout, self.read_timeout)
+            self._states[loop] = state
+        return state
+
+    @asynccontextmanager
+    async def _post(self, path: str, payload: dict):
+        """Wait for an in-flight slot, POST ``payload`` and yield the successful response."""
+        state = self._state()
+        self._count("waiting", 1)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._count("waiting", -1)
+        self._count("in_flight", 1)
+        try:
+            async with state.session.post(f"{self.base_url}{path}", json=payload) as response:
+                if response.status >= 400:
+                    detail = (await response.text())[:500]
+                    raise VllmError(f"vLLM returned HTTP {response.status}: {detail}")
+                yield response
+        except aiohttp.ClientError as e:
+            raise VllmError(f"vLLM request failed: {e}") from e
+        except asyncio.TimeoutError as e:
+            raise VllmError(f"vLLM request timed out (connect {self.connect_timeout}s, read {self.read_timeout}s)") from e
+        finally:
+            self._count("in_flight", -1)
+            self._slots.release()
+
+    def _count_usage(self, usage):
+        self._count("completion_tokens", (usage or {}).get("completion_tokens") or 0)
+
+    async def chat_completion(self, payload: dict) -> dict:
+        async with self._post("/v1/chat/completions", payload) as response:
+            data = await response.json()
+        self._count_usage(data.get("usage"))
+        self._count("completed", 1)
+        return data
+
+    async def stream_chat_completion(self, payload: dict):
+        """Yield content deltas from vLLM's server-sent event stream as they arrive."""
+        # The final chunk then carries token usage (with no choices)
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        async with self._post("/v1/chat/completions", payload) as response:
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError as e:
+                    raise VllmError(f"Malformed vLLM stream chunk: {data[:200]!r}") from e
+                self._count_usage(chunk.get("usage"))
+                choices = chunk.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        self._count("completed", 1)
+
+    async def ping(self, timeout: float = 2.0) -> bool:
+        """True when the server answers its health check within ``timeout`` seconds; never raises."""
+        try:
+            async with self._state().session.get(f"{self.base_url}/health", timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def close(self):
+        """Close the session that belongs to the running event loop."""
+        state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.session.close()